@@ -0,0 +1,41 @@
+"""notify sensor changes
+
+Revision ID: 8e2f4d1c7a90
+Revises: 5c6577394cbb
+Create Date: 2026-10-18 10:12:41.208114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e2f4d1c7a90'
+down_revision = '5c6577394cbb'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        """
+        CREATE FUNCTION notify_sensors_changed() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('thermnet_sensors', '');
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER sensors_changed
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON sensors
+        FOR EACH STATEMENT EXECUTE PROCEDURE notify_sensors_changed()
+        """
+    )
+
+
+def downgrade():
+    op.execute("DROP TRIGGER sensors_changed ON sensors")
+    op.execute("DROP FUNCTION notify_sensors_changed()")
@@ -0,0 +1,135 @@
+"""wide readings
+
+Revision ID: 9b71e0d3c5a4
+Revises: f4c2a9d81e37
+Create Date: 2026-10-18 15:21:06.480339
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b71e0d3c5a4'
+down_revision = 'f4c2a9d81e37'
+branch_labels = None
+depends_on = None
+
+# Quantity IDs and the readings columns holding them
+COLUMNS = {1: "temperature", 2: "pressure", 3: "humidity"}
+
+QUANTITY_IDS = ", ".join(str(id) for id in COLUMNS)
+COLUMN_NAMES = ", ".join(COLUMNS.values())
+COLUMN_DEFINITIONS = ", ".join(f"{column} double precision" for column in COLUMNS.values())
+# One row per quantity of a reading, the shape of the old measurements table
+NARROW_READINGS = """
+    SELECT r.time, m.value, r.sensor, m.quantity
+    FROM readings r CROSS JOIN LATERAL (VALUES {}) AS m (quantity, value)
+    WHERE m.value IS NOT NULL
+""".format(", ".join(f"({id}, r.{column})" for id, column in COLUMNS.items()))
+PIVOTED_MEASUREMENTS = """
+    SELECT time, sensor, {}
+    FROM measurements
+    WHERE sensor IS NOT NULL AND quantity IN ({})
+    GROUP BY time, sensor
+""".format(
+    ", ".join(f"max(value) FILTER (WHERE quantity = {id})" for id in COLUMNS),
+    QUANTITY_IDS,
+)
+
+
+def copy_partitions(source, target):
+    """Give `target` a partition for every range partition of `source`"""
+    op.execute(
+        f"""
+        DO $$
+        DECLARE
+            partition record;
+        BEGIN
+            FOR partition IN
+                SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) AS bound
+                FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                WHERE i.inhparent = '{source}'::regclass
+                AND c.relpartbound IS NOT NULL
+            LOOP
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF {target} %s',
+                    replace(partition.relname, '{source}_', '{target}_'),
+                    partition.bound
+                );
+            END LOOP;
+        END
+        $$
+        """
+    )
+
+
+def upgrade():
+    op.execute(
+        f"""
+        CREATE TABLE readings (
+            time timestamp with time zone NOT NULL,
+            sensor integer NOT NULL REFERENCES sensors (id),
+            {COLUMN_DEFINITIONS}
+        ) PARTITION BY RANGE (time)
+        """
+    )
+    copy_partitions("measurements", "readings")
+    op.create_index("readings_idx", "readings", ["time", "sensor"])
+
+    # Values measured together share their time exactly, that is what the
+    # readings are grouped by
+    op.execute(
+        f"INSERT INTO readings (time, sensor, {COLUMN_NAMES}) {PIVOTED_MEASUREMENTS}"
+    )
+    # Rows of the placeholder sensor or quantity from before the relations
+    # existed have no column to go to, they are set aside instead of lost
+    op.execute(
+        f"""
+        CREATE TABLE measurements_unmigrated AS
+        SELECT * FROM measurements
+        WHERE sensor IS NULL OR quantity NOT IN ({QUANTITY_IDS})
+        """
+    )
+
+    op.execute("DROP TABLE measurements")
+    op.execute(f"CREATE VIEW measurements AS {NARROW_READINGS}")
+
+
+def downgrade():
+    op.execute("DROP VIEW measurements")
+
+    op.execute("CREATE SEQUENCE measurements_id_seq")
+    op.execute(
+        """
+        CREATE TABLE measurements (
+            id integer NOT NULL DEFAULT nextval('measurements_id_seq'),
+            time timestamp with time zone NOT NULL,
+            value double precision NOT NULL,
+            sensor integer REFERENCES sensors (id),
+            quantity integer REFERENCES quantities (id),
+            PRIMARY KEY (id, time)
+        ) PARTITION BY RANGE (time)
+        """
+    )
+    op.execute("ALTER SEQUENCE measurements_id_seq OWNED BY measurements.id")
+    copy_partitions("readings", "measurements")
+    op.create_index("measurements_idx", "measurements", ["time", "quantity", "sensor"])
+
+    op.execute(
+        """
+        INSERT INTO measurements (id, time, value, sensor, quantity)
+        SELECT id, time, value, sensor, quantity FROM measurements_unmigrated
+        """
+    )
+    op.execute(
+        """
+        SELECT setval('measurements_id_seq', max(id))
+        FROM measurements HAVING max(id) IS NOT NULL
+        """
+    )
+    op.execute(
+        f"INSERT INTO measurements (time, value, sensor, quantity) {NARROW_READINGS}"
+    )
+    op.drop_table("measurements_unmigrated")
+    op.drop_table("readings")
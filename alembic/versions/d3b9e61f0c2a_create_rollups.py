@@ -0,0 +1,50 @@
+"""create rollups
+
+Revision ID: d3b9e61f0c2a
+Revises: 8e2f4d1c7a90
+Create Date: 2026-10-18 11:02:19.774306
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3b9e61f0c2a'
+down_revision = '8e2f4d1c7a90'
+branch_labels = None
+depends_on = None
+
+RESOLUTIONS = (60, 900, 3600)
+
+
+def upgrade():
+    op.create_table(
+        "measurement_rollups",
+        sa.Column("resolution", sa.Integer, nullable=False),
+        sa.Column("bucket", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("sensor", sa.Integer, sa.ForeignKey("sensors.id"), nullable=False),
+        sa.Column("quantity", sa.Integer, sa.ForeignKey("quantities.id"), nullable=False),
+        sa.Column("min", sa.Float, nullable=False),
+        sa.Column("max", sa.Float, nullable=False),
+        sa.Column("sum", sa.Float, nullable=False),
+        sa.Column("count", sa.Integer, nullable=False),
+        sa.PrimaryKeyConstraint("resolution", "sensor", "quantity", "bucket"),
+    )
+
+    for resolution in RESOLUTIONS:
+        op.execute(
+            f"""
+            INSERT INTO measurement_rollups
+            SELECT
+                {resolution},
+                to_timestamp(floor(extract(epoch FROM time) / {resolution}) * {resolution}),
+                sensor, quantity, min(value), max(value), sum(value), count(*)
+            FROM measurements
+            GROUP BY 2, sensor, quantity
+            """
+        )
+
+
+def downgrade():
+    op.drop_table("measurement_rollups")
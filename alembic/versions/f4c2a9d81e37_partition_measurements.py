@@ -0,0 +1,117 @@
+"""partition measurements
+
+Revision ID: f4c2a9d81e37
+Revises: d3b9e61f0c2a
+Create Date: 2026-10-18 14:37:52.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4c2a9d81e37'
+down_revision = 'd3b9e61f0c2a'
+branch_labels = None
+depends_on = None
+
+# Partitions past the current month created right away, later ones are added
+# by thermnet.partitions
+AHEAD = 3
+
+
+def upgrade():
+    op.execute("ALTER TABLE measurements RENAME TO measurements_unpartitioned")
+    op.execute("ALTER INDEX measurements_pkey RENAME TO measurements_unpartitioned_pkey")
+    op.execute("ALTER INDEX measurements_idx RENAME TO measurements_unpartitioned_idx")
+    op.execute("ALTER SEQUENCE measurements_id_seq OWNED BY NONE")
+
+    op.execute(
+        """
+        CREATE TABLE measurements (
+            id integer NOT NULL DEFAULT nextval('measurements_id_seq'),
+            time timestamp with time zone NOT NULL,
+            value double precision NOT NULL,
+            sensor integer REFERENCES sensors (id),
+            quantity integer REFERENCES quantities (id),
+            PRIMARY KEY (id, time)
+        ) PARTITION BY RANGE (time)
+        """
+    )
+    op.execute("ALTER SEQUENCE measurements_id_seq OWNED BY measurements.id")
+    op.create_index("measurements_idx", "measurements", ["time", "quantity", "sensor"])
+
+    # Monthly partitions in UTC from the oldest measurement on, rows outside
+    # of all of them land in the default partition instead of failing and
+    # thermnet.partitions moves them out as it creates their ranges
+    op.execute(
+        f"""
+        DO $$
+        DECLARE
+            month timestamp;
+        BEGIN
+            FOR month IN
+                SELECT generate_series(
+                    date_trunc(
+                        'month',
+                        coalesce(min(time), now()) AT TIME ZONE 'UTC'
+                    ),
+                    date_trunc('month', now() AT TIME ZONE 'UTC')
+                        + interval '{AHEAD} months',
+                    interval '1 month'
+                )
+                FROM measurements_unpartitioned
+            LOOP
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF measurements '
+                    'FOR VALUES FROM (%L) TO (%L)',
+                    'measurements_' || to_char(month, 'YYYYMMDD'),
+                    month AT TIME ZONE 'UTC',
+                    (month + interval '1 month') AT TIME ZONE 'UTC'
+                );
+            END LOOP;
+        END
+        $$
+        """
+    )
+    op.execute("CREATE TABLE measurements_default PARTITION OF measurements DEFAULT")
+
+    op.execute(
+        """
+        INSERT INTO measurements (id, time, value, sensor, quantity)
+        SELECT id, time, value, sensor, quantity FROM measurements_unpartitioned
+        """
+    )
+    op.drop_table("measurements_unpartitioned")
+
+
+def downgrade():
+    op.execute("ALTER TABLE measurements RENAME TO measurements_partitioned")
+    op.execute("ALTER INDEX measurements_pkey RENAME TO measurements_partitioned_pkey")
+    op.execute("ALTER INDEX measurements_idx RENAME TO measurements_partitioned_idx")
+    op.execute("ALTER SEQUENCE measurements_id_seq OWNED BY NONE")
+
+    op.create_table(
+        "measurements",
+        sa.Column(
+            "id",
+            sa.Integer,
+            primary_key=True,
+            server_default=sa.text("nextval('measurements_id_seq')"),
+        ),
+        sa.Column("time", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("value", sa.Float, nullable=False),
+        sa.Column("sensor", sa.Integer, sa.ForeignKey("sensors.id")),
+        sa.Column("quantity", sa.Integer, sa.ForeignKey("quantities.id")),
+    )
+    op.execute("ALTER SEQUENCE measurements_id_seq OWNED BY measurements.id")
+    op.create_index("measurements_idx", "measurements", ["time", "quantity", "sensor"])
+
+    op.execute(
+        """
+        INSERT INTO measurements (id, time, value, sensor, quantity)
+        SELECT id, time, value, sensor, quantity FROM measurements_partitioned
+        """
+    )
+    # Takes the partitions along, ones detached as expired are left alone
+    op.execute("DROP TABLE measurements_partitioned")
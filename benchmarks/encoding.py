@@ -0,0 +1,74 @@
+"""Dashboard snapshot encoding benchmark.
+
+Fills a dashboard with ``--hours`` of readings of the three quantities of one
+sensor, one every ``--interval`` seconds, then encodes its snapshot
+``--repeat`` times in every encoding. Prints the payload size, the size after
+zlib as applied by permessage-deflate, and the median encode time.
+"""
+import argparse
+import random
+import statistics
+import time
+import zlib
+from datetime import datetime, timezone
+
+from thermnet.dashboard import Dashboard
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--hours", default=24, type=int)
+parser.add_argument("--interval", default=60, type=int)
+parser.add_argument("--repeat", default=50, type=int)
+
+
+def filled_dashboard(args):
+    dashboard = Dashboard(span=args.hours * 3600)
+    dashboard.quantities = {
+        1: {"name": "temperature", "unit": "°C"},
+        2: {"name": "pressure", "unit": "hPa"},
+        3: {"name": "humidity", "unit": "%"},
+    }
+    rng = random.Random(0)
+    now = int(time.time())
+    for index in range(now - args.hours * 3600 + args.interval, now, args.interval):
+        dashboard.append(
+            0,
+            datetime.fromtimestamp(index, timezone.utc),
+            {
+                1: round(21 + rng.gauss(0, 0.5), 2),
+                2: round(1013 + rng.gauss(0, 2), 2),
+                3: round(45 + rng.gauss(0, 3), 2),
+            },
+        )
+    return dashboard
+
+
+def main(args=None):
+    args = parser.parse_args(args)
+    dashboard = filled_dashboard(args)
+    points = sum(len(window.points) for window in dashboard.windows.values())
+    print(f"{points} points")
+
+    baseline = None
+    # The first one is the baseline
+    for encoding in ("json", "columnar", "binary"):
+        times = []
+        for _ in range(args.repeat):
+            dashboard._payloads.clear()
+            start = time.perf_counter()
+            payload = dashboard.snapshot(0, encoding)
+            times.append(time.perf_counter() - start)
+        if isinstance(payload, str):
+            payload = payload.encode()
+        encode_time = statistics.median(times)
+        size = len(payload)
+        if baseline is None:
+            baseline = size, encode_time
+        print(
+            f"{encoding:9} {size:8} B ({size / baseline[0]:4.0%})  "
+            f"deflated {len(zlib.compress(payload)):7} B  "
+            f"{encode_time * 1000:6.2f} ms ({encode_time / baseline[1]:4.0%})"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Concurrent ingest benchmark for the thermnet server.
+
+Fires ``--requests`` POSTs at ``/measurements/`` from ``--concurrency`` workers
+and reports the achieved throughput. Run it against a server started from each
+revision you want to compare, backed by the same local database. With
+``--stand-in`` it starts a server from ``--config`` itself, its database
+replaced by the in-memory stand-in of ``benchmarks.load`` answering every
+statement after ``--db-latency`` seconds.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import random
+import time
+
+import aiohttp
+
+from benchmarks.load import serve, wait_for_server
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--url", default="http://localhost:8081")
+parser.add_argument("--secret", default="changeme")
+parser.add_argument("--requests", default=5000, type=int)
+parser.add_argument("--concurrency", default=64, type=int)
+parser.add_argument("--stand-in", action="store_true")
+parser.add_argument("--config", default="thermnet.ini")
+parser.add_argument("--db-latency", default=0.001, type=float)
+
+
+async def worker(session, url, secret, counter, latencies, errors):
+    while counter:
+        counter.pop()
+        payload = {
+            "secret": secret,
+            "temperature": random.uniform(15, 25),
+            "pressure": random.uniform(990, 1030),
+            "humidity": random.uniform(30, 60),
+        }
+        start = time.perf_counter()
+        async with session.post(f"{url}/measurements/", json=payload) as response:
+            await response.read()
+            if response.status != 200:
+                errors.append(response.status)
+        latencies.append(time.perf_counter() - start)
+
+
+async def run(args):
+    counter = list(range(args.requests))
+    latencies = []
+    errors = []
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(
+                worker(session, args.url, args.secret, counter, latencies, errors)
+                for _ in range(args.concurrency)
+            )
+        )
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"requests:    {len(latencies)} ({len(errors)} errors)")
+    print(f"elapsed:     {elapsed:.2f} s")
+    print(f"throughput:  {len(latencies) / elapsed:.1f} req/s")
+    print(f"latency p50: {latencies[len(latencies) // 2] * 1000:.1f} ms")
+    print(f"latency p99: {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms")
+
+
+def main(args=None):
+    args = parser.parse_args(args)
+
+    server = None
+    if args.stand_in:
+        port = 18082
+        args.url = f"http://localhost:{port}"
+        # One sensor whose secret is --secret
+        stand_in = argparse.Namespace(
+            config=args.config,
+            sensors=1,
+            secret_format=args.secret,
+            db_latency=args.db_latency,
+        )
+        server = multiprocessing.Process(target=serve, args=(stand_in, port))
+        server.start()
+        asyncio.run(wait_for_server(args.url))
+
+    try:
+        asyncio.run(run(args))
+    finally:
+        if server is not None:
+            server.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+"""End-to-end load test of the thermnet server.
+
+Simulates ``--devices`` devices each POSTing a reading to ``/measurements/``
+every ``--interval`` seconds (give or take ``--jitter``) and ``--clients``
+dashboards each following ``--follow`` sensors over ``/ws/``, for
+``--duration`` seconds. Reports ingest latency, the latency from a POST to
+the update reaching a dashboard and the server's CPU and memory use.
+
+Device ``i`` authenticates as sensor ``i % --sensors`` with the secret
+``--secret-format`` formatted with the sensor ID, so when testing a server
+backed by a local Postgres its sensors table must hold matching rows and the
+server PID must be given with ``--pid`` for the resource figures. With
+``--stand-in`` a server is started from ``--config`` in a child process with
+its database replaced by an in-memory stand-in answering every statement after
+``--db-latency`` seconds, which isolates the cost of the server's own code.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import time
+
+import aiohttp
+from aiohttp import web
+from aiopg.sa.engine import get_dialect
+
+import thermnet.app
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--url", default="http://localhost:8081")
+parser.add_argument("--pid", type=int)
+parser.add_argument("--stand-in", action="store_true")
+parser.add_argument("--config", default="thermnet.ini")
+parser.add_argument("--db-latency", default=0.001, type=float)
+parser.add_argument("--devices", default=2000, type=int)
+parser.add_argument("--sensors", default=200, type=int)
+parser.add_argument("--secret-format", default="sensor-{}")
+parser.add_argument("--interval", default=10.0, type=float)
+parser.add_argument("--jitter", default=0.2, type=float)
+parser.add_argument("--clients", default=200, type=int)
+parser.add_argument("--follow", default=4, type=int)
+parser.add_argument("--duration", default=60.0, type=float)
+parser.add_argument("--connections", default=100, type=int)
+
+
+class StandInResult:
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for row in self.rows:
+            yield row
+
+    async def fetchall(self):
+        return self.rows
+
+
+class StandInConnection:
+    def __init__(self, engine):
+        self.engine = engine
+        self.connection = engine
+
+    def begin(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def execute(self, stmt):
+        self.engine.statements += 1
+        # aiopg compiles every statement on the event loop, so does the stand-in
+        if not isinstance(stmt, str):
+            stmt.compile(dialect=self.engine.dialect).construct_params()
+        if self.engine.latency:
+            await asyncio.sleep(self.engine.latency)
+        # Only the textual queries return rows, writes are discarded
+        sql = stmt if isinstance(stmt, str) else getattr(stmt, "text", "")
+        if "FROM sensors" in sql:
+            return StandInResult(
+                (id, self.engine.secret_format.format(id))
+                for id in range(self.engine.sensors)
+            )
+        if "FROM quantities" in sql:
+            return StandInResult(
+                [(1, "temperature", "°C"), (2, "pressure", "hPa"), (3, "humidity", "%")]
+            )
+        return StandInResult()
+
+
+class StandInEngine:
+    """
+    Just enough of an aiopg.sa engine for the ingest and dashboard paths: a
+    bounded pool, the sensors and quantities tables and nothing else
+    """
+
+    def __init__(self, sensors, secret_format, latency, pool_size):
+        self.sensors = sensors
+        self.secret_format = secret_format
+        self.latency = latency
+        self.dialect = get_dialect()
+        self.statements = 0
+        self.notifies = asyncio.Queue()
+        self.maxsize = self.size = pool_size
+        self.freesize = pool_size
+        self._pool = asyncio.Semaphore(pool_size)
+
+    def acquire(self):
+        return self._Acquire(self)
+
+    class _Acquire:
+        def __init__(self, engine):
+            self.engine = engine
+
+        async def __aenter__(self):
+            await self.engine._pool.acquire()
+            self.engine.freesize -= 1
+            return StandInConnection(self.engine)
+
+        async def __aexit__(self, *exc_info):
+            self.engine.freesize += 1
+            self.engine._pool.release()
+
+    def close(self):
+        pass
+
+    async def wait_closed(self):
+        pass
+
+
+def serve(args, port):
+    async def make_app():
+        application = await thermnet.app.app(args.config)
+        application.on_startup.remove(thermnet.app.create_sqlalchemy)
+
+        async def create_stand_in(app):
+            app["sql_engine"] = StandInEngine(
+                args.sensors,
+                args.secret_format,
+                args.db_latency,
+                app["db_pool_max_size"],
+            )
+
+        application.on_startup.insert(0, create_stand_in)
+        return application
+
+    web.run_app(make_app(), host="localhost", port=port, print=None)
+
+
+class ProcessStats:
+    """CPU time and memory of a local process, read from /proc"""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.start_cpu = self.cpu()
+        self.start_rss = self.memory()["VmRSS"]
+
+    def cpu(self):
+        with open(f"/proc/{self.pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+    def memory(self):
+        with open(f"/proc/{self.pid}/status") as f:
+            return {
+                key: int(value.split()[0]) / 1024
+                for key, value in (line.split(":", 1) for line in f)
+                if key in ("VmRSS", "VmHWM")
+            }
+
+
+def percentile(values, p):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+class Load:
+    def __init__(self, args):
+        self.args = args
+        self.deadline = None
+        self.ingest_latencies = []
+        self.update_latencies = []
+        self.errors = 0
+        self.sent = {}
+        self.tokens = itertools.count()
+        self.updates = 0
+
+    async def device(self, session, i):
+        args = self.args
+        secret = args.secret_format.format(i % args.sensors)
+        await asyncio.sleep(random.uniform(0, args.interval))
+        while time.perf_counter() < self.deadline:
+            # Every temperature is unique, so dashboards can tell which POST
+            # an update came from
+            temperature = 20 + next(self.tokens) / 1e6
+            payload = {
+                "secret": secret,
+                "temperature": temperature,
+                "pressure": random.uniform(990, 1030),
+                "humidity": random.uniform(30, 60),
+            }
+            start = time.perf_counter()
+            self.sent[temperature] = start
+            try:
+                async with session.post(
+                    f"{args.url}/measurements/", json=payload
+                ) as response:
+                    await response.read()
+                    if response.status != 200:
+                        self.errors += 1
+            except aiohttp.ClientError:
+                self.errors += 1
+            self.ingest_latencies.append(time.perf_counter() - start)
+            jitter = random.uniform(-args.jitter, args.jitter)
+            await asyncio.sleep(args.interval * (1 + jitter))
+
+    async def client(self, session):
+        args = self.args
+        sensors = random.sample(range(args.sensors), min(args.follow, args.sensors))
+        url = f"{args.url}/ws/?sensors={','.join(map(str, sensors))}"
+        async with session.ws_connect(url, max_msg_size=0) as ws:
+            while True:
+                timeout = self.deadline - time.perf_counter()
+                if timeout <= 0:
+                    return
+                try:
+                    msg = await ws.receive(timeout)
+                except asyncio.TimeoutError:
+                    return
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    return
+                now = time.perf_counter()
+                message = json.loads(msg.data)
+                if message["type"] != "delta":
+                    continue
+                self.updates += 1
+                for point in message["append"]:
+                    if point["quantity"] == 1 and point["value"] in self.sent:
+                        self.update_latencies.append(now - self.sent[point["value"]])
+
+    async def run(self):
+        args = self.args
+        # Dashboards hold a connection each, devices share a bounded pool
+        dashboards = aiohttp.TCPConnector(limit=0)
+        devices = aiohttp.TCPConnector(limit=args.connections)
+        async with aiohttp.ClientSession(connector=dashboards) as session:
+            self.deadline = time.perf_counter() + args.duration
+            clients = [
+                asyncio.ensure_future(self.client(session))
+                for _ in range(args.clients)
+            ]
+            async with aiohttp.ClientSession(connector=devices) as device_session:
+                await asyncio.gather(
+                    *(self.device(device_session, i) for i in range(args.devices))
+                )
+            await asyncio.gather(*clients, return_exceptions=True)
+
+
+async def wait_for_server(url, timeout=10.0):
+    deadline = time.perf_counter() + timeout
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.get(f"{url}/"):
+                    return
+            except aiohttp.ClientError:
+                if time.perf_counter() > deadline:
+                    raise
+                await asyncio.sleep(0.1)
+
+
+def main(args=None):
+    args = parser.parse_args(args)
+
+    server = None
+    pid = args.pid
+    if args.stand_in:
+        port = 18081
+        args.url = f"http://localhost:{port}"
+        server = multiprocessing.Process(target=serve, args=(args, port))
+        server.start()
+        pid = server.pid
+        asyncio.run(wait_for_server(args.url))
+
+    try:
+        stats = ProcessStats(pid) if pid else None
+        load = Load(args)
+        start = time.perf_counter()
+        asyncio.run(load.run())
+        elapsed = time.perf_counter() - start
+        cpu = stats.cpu() - stats.start_cpu if stats else None
+        memory = stats.memory() if stats else None
+    finally:
+        if server is not None:
+            server.terminate()
+            server.join()
+
+    ingest = load.ingest_latencies
+    update = load.update_latencies
+    print(f"requests:       {len(ingest)} ({load.errors} errors)")
+    print(f"throughput:     {len(ingest) / elapsed:.1f} req/s")
+    print(f"ingest p50:     {percentile(ingest, 0.5) * 1000:.1f} ms")
+    print(f"ingest p99:     {percentile(ingest, 0.99) * 1000:.1f} ms")
+    print(f"updates:        {load.updates} to {args.clients} clients")
+    print(f"update p50:     {percentile(update, 0.5) * 1000:.1f} ms")
+    print(f"update p99:     {percentile(update, 0.99) * 1000:.1f} ms")
+    if stats:
+        print(f"server cpu:     {cpu:.1f} s ({cpu / elapsed * 100:.0f}%)")
+        print(
+            f"server rss:     {stats.start_rss:.0f} -> {memory['VmRSS']:.0f} MiB "
+            f"(peak {memory['VmHWM']:.0f} MiB)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""Query plan benchmark for the hot read queries.
+
+Loads ``--years`` of synthetic readings of ``--sensors`` sensors, one every
+``--interval`` seconds, into monthly partitions of a readings table in the
+scratch schema ``--schema`` of a local Postgres, along with their rollups.
+The series queries are built the way the series endpoint builds them for
+its default ``max_points``, so most of them read rollups. Then, for every index
+layout, it records the median EXPLAIN ANALYZE execution time and buffer
+usage of each hot query over ``--repeat`` runs. ``--output`` saves the
+results as JSON to compare revisions. The schema is dropped and recreated
+unless ``--skip-load`` reuses the data of a previous run.
+"""
+import argparse
+import json
+import statistics
+from datetime import datetime, timedelta, timezone
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.sql import text
+
+from thermnet.app import DEFAULT_MAX_POINTS
+from thermnet.history import pick_resolution, select_series
+from thermnet.partitions import plan
+from thermnet.storage import COLUMNS, ROLLUP_RESOLUTIONS
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--url", default="postgresql://thermnet@localhost/thermnet")
+parser.add_argument("--schema", default="thermnet_bench")
+parser.add_argument("--years", default=2.0, type=float)
+parser.add_argument("--sensors", default=10, type=int)
+parser.add_argument("--interval", default=60, type=int)
+parser.add_argument("--repeat", default=5, type=int)
+parser.add_argument("--output")
+parser.add_argument("--skip-load", action="store_true")
+
+# Index layouts compared, the first one is what the migrations shipped before
+# a5d8c3e9f210 and the second what they ship since
+LAYOUTS = {
+    "time_sensor": ["CREATE INDEX ON readings (time, sensor)"],
+    "time_sensor_and_covering": [
+        "CREATE INDEX ON readings (time, sensor)",
+        "CREATE INDEX ON readings (sensor, time) "
+        f"INCLUDE ({', '.join(COLUMNS.values())})",
+    ],
+    "sensor_time_covering": [
+        "CREATE INDEX ON readings (sensor, time) "
+        f"INCLUDE ({', '.join(COLUMNS.values())})"
+    ],
+    "sensor_time_covering_brin": [
+        "CREATE INDEX ON readings (sensor, time) "
+        f"INCLUDE ({', '.join(COLUMNS.values())})",
+        "CREATE INDEX ON readings USING brin (time)",
+    ],
+}
+
+
+def hot_queries(end):
+    """SQL and parameters of the queries behind the dashboard, by name"""
+
+    def compiled(stmt):
+        compiled = stmt.compile(dialect=postgresql.dialect(paramstyle="named"))
+        return str(compiled), compiled.params
+
+    def series(quantity, days, days_ago=0):
+        stop = end - timedelta(days=days_ago)
+        start = stop - timedelta(days=days)
+        resolution = pick_resolution(start, stop, DEFAULT_MAX_POINTS)
+        return compiled(select_series(0, quantity, start, stop, resolution))
+
+    # The dashboard seed, with NOW() pinned to the end of the data
+    seed = f"""
+        SELECT time, sensor, {", ".join(COLUMNS.values())} FROM readings
+        WHERE time BETWEEN CAST(:end AS timestamptz) - INTERVAL '24 HOURS'
+        AND CAST(:end AS timestamptz)
+        ORDER BY time
+    """
+    return {
+        "dashboard_seed": (seed, {"end": end}),
+        "series_day": series(1, 1),
+        "series_week": series(1, 7),
+        "series_month": series(1, 30),
+        "series_old_day": series(2, 1, 180),
+        # A page of raw rows, as with resolution=raw
+        "series_day_raw": compiled(
+            select_series(0, 1, end - timedelta(days=1), end).limit(
+                DEFAULT_MAX_POINTS + 1
+            )
+        ),
+    }
+
+
+def load(conn, args, start, end):
+    conn.execute(text(f"DROP SCHEMA IF EXISTS {args.schema} CASCADE"))
+    conn.execute(text(f"CREATE SCHEMA {args.schema}"))
+    conn.execute(text(f"SET search_path TO {args.schema}"))
+    conn.execute(
+        text(
+            f"""
+            CREATE TABLE readings (
+                time timestamp with time zone NOT NULL,
+                sensor integer NOT NULL,
+                {", ".join(f"{column} double precision" for column in COLUMNS.values())}
+            ) PARTITION BY RANGE (time)
+            """
+        )
+    )
+    months = int((end - start).days / 28) + 1
+    for name, first, stop in plan([], start, "month", months, None):
+        conn.execute(
+            text(
+                f'CREATE TABLE "{name}" PARTITION OF readings '
+                f"FOR VALUES FROM ('{first.isoformat()}') TO ('{stop.isoformat()}')"
+            )
+        )
+
+    print(f"loading {args.years} years of {args.sensors} sensors...")
+    conn.execute(
+        text(
+            f"""
+            INSERT INTO readings
+            SELECT
+                t, s,
+                20 + 5 * sin(extract(epoch FROM t) / 86400) + random(),
+                1013 + 10 * random(),
+                50 + 20 * random()
+            FROM generate_series(
+                TIMESTAMPTZ '{start.isoformat()}',
+                TIMESTAMPTZ '{end.isoformat()}',
+                INTERVAL '{args.interval} seconds'
+            ) AS t
+            CROSS JOIN generate_series(0, {args.sensors - 1}) AS s
+            ORDER BY t, s
+            """
+        )
+    )
+
+    # Rollups as ingest maintains them, with the primary key of the migration
+    print("computing rollups...")
+    conn.execute(
+        text(
+            """
+            CREATE TABLE measurement_rollups (
+                resolution integer NOT NULL,
+                bucket timestamp with time zone NOT NULL,
+                sensor integer NOT NULL,
+                quantity integer NOT NULL,
+                min double precision NOT NULL,
+                max double precision NOT NULL,
+                sum double precision NOT NULL,
+                count integer NOT NULL,
+                PRIMARY KEY (resolution, sensor, quantity, bucket)
+            )
+            """
+        )
+    )
+    values = ", ".join(f"({id}, {column})" for id, column in COLUMNS.items())
+    for resolution in ROLLUP_RESOLUTIONS:
+        conn.execute(
+            text(
+                f"""
+                INSERT INTO measurement_rollups
+                SELECT
+                    {resolution},
+                    to_timestamp(
+                        floor(extract(epoch FROM time) / {resolution}) * {resolution}
+                    ),
+                    sensor, m.quantity,
+                    min(m.value), max(m.value), sum(m.value), count(*)
+                FROM readings
+                CROSS JOIN LATERAL (VALUES {values}) AS m (quantity, value)
+                WHERE m.value IS NOT NULL
+                GROUP BY 2, sensor, m.quantity
+                """
+            )
+        )
+    conn.execute(text("VACUUM ANALYZE measurement_rollups"))
+
+
+def drop_indexes(conn):
+    names = conn.execute(
+        text(
+            """
+            SELECT indexname FROM pg_indexes
+            WHERE schemaname = current_schema() AND tablename = 'readings'
+            """
+        )
+    ).fetchall()
+    for (name,) in names:
+        conn.execute(text(f'DROP INDEX "{name}"'))
+
+
+def explain(conn, sql, params):
+    (plan_,) = conn.execute(
+        text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}"), params
+    ).fetchone()
+    if isinstance(plan_, str):
+        plan_ = json.loads(plan_)
+    root = plan_[0]
+    return {
+        "time_ms": root["Execution Time"],
+        "plan": root["Plan"]["Node Type"],
+        "shared_hit": root["Plan"].get("Shared Hit Blocks", 0),
+        "shared_read": root["Plan"].get("Shared Read Blocks", 0),
+    }
+
+
+def index_size(conn):
+    (size,) = conn.execute(
+        text(
+            """
+            SELECT coalesce(sum(pg_relation_size(indexrelid)), 0)
+            FROM pg_index JOIN pg_class c ON c.oid = indrelid
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = current_schema() AND c.relname LIKE 'readings%'
+            """
+        )
+    ).fetchone()
+    return int(size)
+
+
+def main(args=None):
+    args = parser.parse_args(args)
+    end = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    start = end - timedelta(days=365 * args.years)
+
+    # VACUUM refuses to run in a transaction
+    engine = sa.create_engine(args.url, isolation_level="AUTOCOMMIT")
+    results = {}
+    with engine.connect() as conn:
+        if not args.skip_load:
+            load(conn, args, start, end)
+        conn.execute(text(f"SET search_path TO {args.schema}"))
+        queries = hot_queries(
+            conn.execute(text("SELECT max(time) FROM readings")).scalar()
+        )
+
+        for layout, statements in LAYOUTS.items():
+            drop_indexes(conn)
+            for statement in statements:
+                conn.execute(text(statement))
+            conn.execute(text("VACUUM ANALYZE readings"))
+
+            results[layout] = {"index_bytes": index_size(conn)}
+            print(f"\n{layout} ({results[layout]['index_bytes'] / 2 ** 20:.0f} MiB)")
+            for name, (sql, params) in queries.items():
+                runs = [explain(conn, sql, params) for _ in range(args.repeat)]
+                result = dict(runs[-1])
+                result["time_ms"] = statistics.median(run["time_ms"] for run in runs)
+                results[layout][name] = result
+                print(
+                    f"  {name:16} {result['time_ms']:9.2f} ms  "
+                    f"{result['plan']:24} hit {result['shared_hit']:6} "
+                    f"read {result['shared_read']}"
+                )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Sensor sampling benchmark on simulated hardware.
+
+Attaches ``--sensors`` simulated BME280s spread over ``--buses`` simulated I2C
+buses and times opening the drivers, reading a single sensor in a loop and
+``--cycles`` sampling cycles of the poller. ``--byte-time`` models the bus
+speed (about 90 us per byte at 100 kHz) and ``--time-scale`` the conversion
+delays, 0 makes conversions instantaneous to measure pure CPU cost.
+"""
+import argparse
+import time
+
+from thermnet.bme280 import Adafruit_BME280_I2C
+from thermnet.sensor import Poller
+from thermnet.simulation import SimulatedBME280, SimulatedBus
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--sensors", default=8, type=int)
+parser.add_argument("--buses", default=2, type=int)
+parser.add_argument("--cycles", default=20, type=int)
+parser.add_argument("--reads", default=1000, type=int)
+parser.add_argument("--byte-time", default=0.0, type=float)
+parser.add_argument("--time-scale", default=1.0, type=float)
+parser.add_argument("--noise", default=0.1, type=float)
+
+
+def open_sensors(args):
+    buses = [
+        SimulatedBus(
+            factory=lambda address, bus=bus: SimulatedBME280(
+                noise=args.noise, time_scale=args.time_scale, seed=f"{bus}:{address}"
+            ),
+            byte_time=args.byte_time,
+        )
+        for bus in range(args.buses)
+    ]
+    return buses, [
+        (i, i % args.buses, Adafruit_BME280_I2C(buses[i % args.buses], 0x08 + i))
+        for i in range(args.sensors)
+    ]
+
+
+def main(args=None):
+    args = parser.parse_args(args)
+
+    start = time.perf_counter()
+    buses, sensors = open_sensors(args)
+    elapsed = time.perf_counter() - start
+    print(f"open:        {elapsed / args.sensors * 1000:.2f} ms/sensor")
+
+    calibration = sensors[0][2].calibration
+    start = time.perf_counter()
+    for i in range(args.sensors):
+        Adafruit_BME280_I2C(buses[i % args.buses], 0x08 + i, calibration)
+    elapsed = time.perf_counter() - start
+    print(f"open cached: {elapsed / args.sensors * 1000:.2f} ms/sensor")
+
+    bme = sensors[0][2]
+    transactions = buses[0].transactions
+    start = time.perf_counter()
+    for _ in range(args.reads):
+        bme.read_all()
+    elapsed = time.perf_counter() - start
+    transactions = (buses[0].transactions - transactions) / args.reads
+    print(f"read_all:    {elapsed / args.reads * 1000:.3f} ms ({transactions:.1f} txn)")
+
+    poller = Poller(sensors)
+    latencies = []
+    for _ in range(args.cycles):
+        start = time.perf_counter()
+        readings = poller.sample()
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    print(f"readings:    {len(readings)} per cycle")
+    print(f"cycle p50:   {latencies[len(latencies) // 2] * 1000:.1f} ms")
+    print(f"cycle max:   {latencies[-1] * 1000:.1f} ms")
+    poller.executor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -13,30 +13,54 @@ const plotTemperature = createPlot(d3.select("#plotTemperature").attr("viewBox",
 const plotHumidity = createPlot(d3.select("#plotHumidity").attr("viewBox", [0, 0, width, height]), "Wilgotność względna [%] (ostatnie 24 h)", "#859900");
 const plotPressure = createPlot(d3.select("#plotPressure").attr("viewBox", [0, 0, width, height]), "Ciśnienie atmosferyczne [hPa] (ostatnie 24 h)", "#268bd2");
 
+// Snapshot encodings in order of preference, see thermnet/encoding.py.
+// Browsers always offer permessage-deflate and aiohttp accepts it, deflated
+// columnar JSON is the smallest (a 24 h window: 8.9 kB against 12.4 kB as
+// binary and 23.4 kB as object JSON), binary is for clients without deflate
+const protocols = ["thermnet-columnar", "thermnet-binary", "thermnet-json"];
+
 function connectSocket(url) {
-  const webSocket = new WebSocket(url);
+  const webSocket = new WebSocket(url, protocols);
+  webSocket.binaryType = "arraybuffer";
 
   webSocket.onopen = event => {
     console.log("WebSocket is open now:", event);
     setStatusBar(Status.WAITING_FOR_DATA);
   };
 
+  const states = new Map();
+
   webSocket.onmessage = function (event) {
     console.log("WebSocket message received:", event);
-    document.getElementById("lastUpdated").innerHTML = (new Date).toLocaleTimeString();
 
-    const data = JSON.parse(event.data);
-    console.log("Data parsed:", data);
+    const message = event.data instanceof ArrayBuffer ? decodeBinary(event.data) : JSON.parse(event.data);
+    console.log("Data parsed:", message);
 
-    document.getElementById("temperatureValue").innerHTML = data[0].measurements.slice(-1)[0].value.toFixed(1);
-    document.getElementById("humidityValue").innerHTML = data[2].measurements.slice(-1)[0].value.toFixed(1);
-    document.getElementById("pressureValue").innerHTML = data[1].measurements.slice(-1)[0].value.toFixed(1);
-    console.log("Updated current temperature");
+    if (!states.has(message.sensor)) {
+      states.set(message.sensor, {seq: null, series: null});
+    }
+    const state = states.get(message.sensor);
 
-    updatePlot(plotTemperature, "%H:%M", data[0].measurements)
-    updatePlot(plotHumidity, "%H:%M", data[2].measurements)
-    updatePlot(plotPressure, "%H:%M", data[1].measurements)
+    if (message.type === "snapshot") {
+      state.seq = message.seq;
+      state.series = new Map(message.series.map(x => [x.quantity, toColumns(x)]));
+    } else if (message.type === "delta") {
+      if (state.series === null || message.seq <= state.seq) {
+        return;
+      }
+      if (message.seq !== state.seq + 1 || !applyDelta(state, message)) {
+        console.warn("Missed an update, requesting resync");
+        state.series = null;
+        webSocket.send(JSON.stringify({type: "resync", sensor: message.sensor}));
+        return;
+      }
+    } else {
+      console.warn("Unknown message type:", message.type);
+      return;
+    }
 
+    document.getElementById("lastUpdated").innerHTML = (new Date).toLocaleTimeString();
+    render(state.series);
     setStatusBar(Status.UPDATING);
   }
 
@@ -51,6 +75,131 @@ function connectSocket(url) {
   };
 }
 
+// Binary snapshot, little-endian: u8 type, u8 version, u16 series count,
+// i32 sensor, u32 seq, then per series u16 quantity, u8 name length, u8 unit
+// length, u32 count, the name and unit padded to 4 bytes, i32 times and
+// f32 values
+function decodeBinary(buffer) {
+  const view = new DataView(buffer);
+  const message = {
+    type: view.getUint8(0) === 1 ? "snapshot" : "unknown",
+    version: view.getUint8(1),
+    sensor: view.getInt32(4, true),
+    seq: view.getUint32(8, true),
+    series: [],
+  };
+  const decoder = new TextDecoder();
+  let offset = 12;
+  for (let i = 0; i < view.getUint16(2, true); i++) {
+    const quantity = view.getUint16(offset, true);
+    const nameLength = view.getUint8(offset + 2);
+    const unitLength = view.getUint8(offset + 3);
+    const count = view.getUint32(offset + 4, true);
+    offset += 8;
+    const name = decoder.decode(new Uint8Array(buffer, offset, nameLength));
+    const unit = decoder.decode(new Uint8Array(buffer, offset + nameLength, unitLength));
+    offset += Math.ceil((nameLength + unitLength) / 4) * 4;
+    const times = new Int32Array(buffer, offset, count);
+    offset += 4 * count;
+    const values = new Float32Array(buffer, offset, count);
+    offset += 4 * count;
+    message.series.push({quantity, name, unit, times, values});
+  }
+  return message;
+}
+
+// Snapshot series of any encoding as parallel arrays of times and values
+function toColumns(series) {
+  const columns = {quantity: series.quantity, name: series.name, unit: series.unit};
+  if ("measurements" in series) {
+    columns.times = series.measurements.map(d => d.index);
+    columns.values = series.measurements.map(d => d.value);
+  } else if (Array.isArray(series.times)) {
+    // Columnar JSON times are differences from the previous one
+    columns.times = new Array(series.times.length);
+    let time = 0;
+    for (let i = 0; i < series.times.length; i++) {
+      time += series.times[i];
+      columns.times[i] = time;
+    }
+    columns.values = series.values;
+  } else {
+    columns.times = series.times;
+    columns.values = series.values;
+  }
+  return columns;
+}
+
+// Typed arrays of a binary snapshot cannot grow or shrink, they are copied
+// into plain arrays once, on the first delta touching them
+function growable(series) {
+  if (!Array.isArray(series.times)) {
+    series.times = Array.from(series.times);
+    series.values = Array.from(series.values);
+  }
+  return series;
+}
+
+function applyDelta(state, delta) {
+  for (const point of delta.append) {
+    if (!state.series.has(point.quantity)) {
+      return false;
+    }
+    const series = growable(state.series.get(point.quantity));
+    // Late readings are rare, keep them ordered
+    let position = series.times.length;
+    while (position > 0 && series.times[position - 1] > point.index) {
+      position--;
+    }
+    series.times.splice(position, 0, point.index);
+    series.values.splice(position, 0, point.value);
+  }
+
+  for (const series of state.series.values()) {
+    let expired = 0;
+    while (expired < series.times.length && series.times[expired] < delta.expire) {
+      expired++;
+    }
+    if (expired > 0) {
+      growable(series);
+      series.times.splice(0, expired);
+      series.values.splice(0, expired);
+    }
+  }
+
+  state.seq = delta.seq;
+  return true;
+}
+
+function render(series) {
+  const byName = name => {
+    for (const x of series.values()) {
+      if (x.name === name && x.times.length > 0) {
+        return x;
+      }
+    }
+    return null;
+  };
+
+  const temperature = byName("temperature");
+  const humidity = byName("humidity");
+  const pressure = byName("pressure");
+
+  if (temperature !== null) {
+    document.getElementById("temperatureValue").innerHTML = temperature.values[temperature.values.length - 1].toFixed(1);
+    updatePlot(plotTemperature, "%H:%M", temperature);
+  }
+  if (humidity !== null) {
+    document.getElementById("humidityValue").innerHTML = humidity.values[humidity.values.length - 1].toFixed(1);
+    updatePlot(plotHumidity, "%H:%M", humidity);
+  }
+  if (pressure !== null) {
+    document.getElementById("pressureValue").innerHTML = pressure.values[pressure.values.length - 1].toFixed(1);
+    updatePlot(plotPressure, "%H:%M", pressure);
+  }
+  console.log("Updated plots");
+}
+
 function createPlot(svg, title, color, minmax=false) {
   svg.append("text")
     .attr("x", width / 2)
@@ -100,9 +249,9 @@ function createPlot(svg, title, color, minmax=false) {
   return plot
 }
 
-function updatePlot(plot, timeFormat, data) {
+function updatePlot(plot, timeFormat, series) {
     plot.x.domain([new Date - 24 * 3600 * 1000, new Date()]);
-    plot.y.domain(d3.extent(data, d => d.value)).nice();
+    plot.y.domain(d3.extent(series.values)).nice();
 
     plot.xAxis
       .call(
@@ -121,18 +270,18 @@ function updatePlot(plot, timeFormat, data) {
       .call(g => g.select(".domain").remove());
 
     plot.line
-      .datum(data)
+      .datum(d3.range(series.times.length))
       .attr("d", d3
         .line()
-        .x(d => {
-          return plot.x(d.index * 1000);
+        .x(i => {
+          return plot.x(series.times[i] * 1000);
         })
-        .y(d => {
-          return plot.y(d.value);
+        .y(i => {
+          return plot.y(series.values[i]);
         }));
 
     if ("minLine" in plot && "minText" in plot && "maxLine" in plot && "maxText" in plot) {
-      const yMin = Math.min(...data.map(x => x.data));
+      const yMin = d3.min(series.values);
       plot.minLine
         .attr("x1", margin.left)
         .attr("x2", width)
@@ -144,7 +293,7 @@ function updatePlot(plot, timeFormat, data) {
         .attr("y", plot.y(yMin))
         .text(yMin.toFixed(1));
 
-      const yMax = Math.max(...data.map(x => x.data));
+      const yMax = d3.max(series.values);
       plot.maxLine
         .attr("x1", margin.left)
         .attr("x2", width)
@@ -1,2 +1,3 @@
 setStatusBar(Status.CONNECTING);
-connectSocket(`ws://${window.location.host}/ws/`);
+const sensor = new URLSearchParams(window.location.search).get("sensor") || "0";
+connectSocket(`ws://${window.location.host}/ws/?sensors=${encodeURIComponent(sensor)}`);
@@ -0,0 +1,34 @@
+import random
+
+import pytest
+
+from thermnet.bme280 import Adafruit_BME280_I2C, compensate_arrays
+from thermnet.simulation import SimulatedBME280, SimulatedBus
+
+ADDRESS = 0x76
+
+
+@pytest.fixture
+def bme():
+    # The datasheet's calibration, as the driver reads it from the registers
+    return Adafruit_BME280_I2C(SimulatedBus({ADDRESS: SimulatedBME280()}), ADDRESS)
+
+
+def test_compensate_arrays_matches_compensate_raw(bme):
+    np = pytest.importorskip("numpy")
+    rng = random.Random(0)
+    # Whole register ranges, clamped results included
+    raw = [
+        (rng.randrange(1 << 24), rng.randrange(1 << 24), rng.randrange(1 << 16))
+        for _ in range(10000)
+    ]
+
+    temperature, pressure, humidity = compensate_arrays(
+        *zip(*raw), bme._temp_calib, bme._pressure_calib, bme._humidity_calib
+    )
+
+    expected = np.array([bme.compensate_raw(*triple) for triple in raw])
+    # Bit for bit, not approximately
+    assert temperature.tolist() == expected[:, 0].tolist()
+    assert pressure.tolist() == expected[:, 1].tolist()
+    assert humidity.tolist() == expected[:, 2].tolist()
@@ -0,0 +1,135 @@
+import json
+from datetime import datetime, timezone
+from time import time
+from unittest import mock
+
+import pytest
+
+from thermnet.dashboard import Dashboard, Subscriber
+
+NOW = int(time())
+
+
+def at(index):
+    return datetime.fromtimestamp(index, timezone.utc)
+
+
+def decoded(messages):
+    return [json.loads(message) for message in messages]
+
+
+@pytest.fixture
+def dashboard():
+    dashboard = Dashboard(span=3600, delta_history=4)
+    dashboard.quantities = {1: {"name": "temperature", "unit": "°C"}}
+    return dashboard
+
+
+def test_snapshot_then_deltas(dashboard):
+    dashboard.append(0, at(NOW - 20), {1: 20.0})
+    subscriber = Subscriber()
+    dashboard.subscribe(subscriber, [0])
+
+    (snapshot,) = decoded(dashboard.pending(subscriber))
+    assert snapshot["type"] == "snapshot"
+    assert snapshot["seq"] == 1
+    (series,) = snapshot["series"]
+    assert series["measurements"] == [{"index": NOW - 20, "value": 20.0}]
+    assert dashboard.pending(subscriber) == []
+
+    dashboard.append(0, at(NOW - 10), {1: 21.0})
+    dashboard.append(0, at(NOW), {1: 22.0})
+    dashboard.publish({0})
+    deltas = decoded(dashboard.pending(subscriber))
+    assert [delta["type"] for delta in deltas] == ["delta", "delta"]
+    assert [delta["seq"] for delta in deltas] == [2, 3]
+    assert deltas[1]["append"] == [{"quantity": 1, "index": NOW, "value": 22.0}]
+    assert subscriber.seqs[0] == 3
+
+
+def test_snapshot_after_too_many_missed_deltas(dashboard):
+    subscriber = Subscriber()
+    dashboard.subscribe(subscriber, [0])
+    dashboard.pending(subscriber)
+
+    # One more than delta_history, the oldest missed delta is gone
+    for i in range(5):
+        dashboard.append(0, at(NOW - 10 + i), {1: float(i)})
+    dashboard.publish({0})
+
+    (snapshot,) = decoded(dashboard.pending(subscriber))
+    assert snapshot["type"] == "snapshot"
+    assert snapshot["seq"] == 5
+    (series,) = snapshot["series"]
+    assert len(series["measurements"]) == 5
+
+
+def test_exactly_delta_history_missed_deltas(dashboard):
+    subscriber = Subscriber()
+    dashboard.subscribe(subscriber, [0])
+    dashboard.pending(subscriber)
+
+    for i in range(4):
+        dashboard.append(0, at(NOW - 10 + i), {1: float(i)})
+    dashboard.publish({0})
+
+    messages = decoded(dashboard.pending(subscriber))
+    assert [message["seq"] for message in messages] == [1, 2, 3, 4]
+    assert {message["type"] for message in messages} == {"delta"}
+
+
+def test_late_reading_is_ordered(dashboard):
+    for index in (NOW - 30, NOW - 10, NOW - 20, NOW - 10):
+        dashboard.append(0, at(index), {1: float(NOW - index)})
+
+    (series,) = json.loads(dashboard.snapshot(0))["series"]
+    assert [point["index"] for point in series["measurements"]] == [
+        NOW - 30,
+        NOW - 20,
+        NOW - 10,
+        NOW - 10,
+    ]
+
+
+def test_expiry_drops_cached_snapshot(dashboard):
+    dashboard.append(0, at(NOW - 3000), {1: 1.0})
+    dashboard.append(0, at(NOW), {1: 2.0})
+    assert dashboard.snapshot(0, "json") is dashboard.snapshot(0, "json")
+
+    with mock.patch("thermnet.dashboard.time", return_value=NOW + 1000):
+        (series,) = json.loads(dashboard.snapshot(0))["series"]
+    assert series["measurements"] == [{"index": NOW, "value": 2.0}]
+
+
+def test_readings_older_than_window_are_ignored(dashboard):
+    dashboard.append(0, at(NOW - 7200), {1: 1.0})
+    assert dashboard.seqs[0] == 0
+    assert json.loads(dashboard.snapshot(0))["series"] == []
+
+
+def test_resync(dashboard):
+    dashboard.append(0, at(NOW), {1: 1.0})
+    subscriber = Subscriber("columnar")
+    dashboard.subscribe(subscriber, [0])
+    dashboard.pending(subscriber)
+    assert dashboard.pending(subscriber) == []
+
+    dashboard.resync(subscriber, 0)
+    (snapshot,) = decoded(dashboard.pending(subscriber))
+    assert snapshot["type"] == "snapshot"
+    assert snapshot["encoding"] == "columnar"
+    assert snapshot["series"][0]["values"] == [1.0]
+
+    # Sensors the client does not follow are not resynced
+    dashboard.resync(subscriber, 1)
+    assert dashboard.pending(subscriber) == []
+
+
+def test_unsubscribe_forgets_subscriber(dashboard):
+    subscriber = Subscriber()
+    dashboard.subscribe(subscriber, [0, 1])
+    dashboard.subscribe(subscriber, [1])
+    assert set(dashboard._subscribers) == {1}
+    dashboard.unsubscribe(subscriber)
+    assert not dashboard._subscribers
+    assert subscriber.seqs == {}
@@ -0,0 +1,97 @@
+import time
+
+import pytest
+
+from thermnet.bme280 import Adafruit_BME280_I2C
+from thermnet.sensor import Poller
+from thermnet.simulation import SimulatedBME280, SimulatedBus
+
+ADDRESS = 0x76
+
+
+class RecordingBus(SimulatedBus):
+    """Simulated bus keeping the (register, length) of every read and write"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reads = []
+        self.writes = []
+
+    def read_i2c_block_data(self, address, register, length):
+        self.reads.append((register, length))
+        return super().read_i2c_block_data(address, register, length)
+
+    def write_byte_data(self, address, register, value):
+        self.writes.append((register, value))
+        super().write_byte_data(address, register, value)
+
+
+def open_sensor(calibration=None, **kwargs):
+    kwargs.setdefault("time_scale", 0)
+    bus = RecordingBus({ADDRESS: SimulatedBME280(**kwargs)})
+    return bus, Adafruit_BME280_I2C(bus, ADDRESS, calibration)
+
+
+def test_read_all_returns_simulated_values():
+    bus, bme = open_sensor(temperature=23.4, pressure=987.6, humidity=56.7)
+
+    before = bus.transactions
+    temperature, pressure, humidity = bme.read_all()
+    read_all = bus.transactions - before
+
+    assert temperature == pytest.approx(23.4, abs=0.01)
+    assert pressure == pytest.approx(987.6, abs=0.01)
+    assert humidity == pytest.approx(56.7, abs=0.01)
+
+    before = bus.transactions
+    assert (bme.temperature, bme.pressure, bme.humidity) == pytest.approx(
+        (temperature, pressure, humidity), abs=0.01
+    )
+    assert read_all < bus.transactions - before
+
+
+def test_cached_calibration_skips_reset_and_coefficients():
+    _, bme = open_sensor()
+    calibration = bme.calibration
+
+    bus, cached = open_sensor(calibration)
+
+    assert cached.calibration == calibration
+    # Only the 6 byte check at dig_T1, no soft reset
+    assert (0x88, 24) not in bus.reads
+    assert (0x88, 6) in bus.reads
+    assert not any(register in (0xA1, 0xE1) for register, _ in bus.reads)
+    assert not any(register == 0xE0 for register, _ in bus.writes)
+
+
+def test_stale_calibration_is_read_again():
+    _, bme = open_sensor()
+    calibration = dict(bme.calibration, check="00" * 6)
+
+    bus, fresh = open_sensor(calibration)
+
+    assert (0x88, 24) in bus.reads
+    assert (0xE0, 0xB6) in bus.writes
+    assert fresh.calibration == bme.calibration
+
+
+def test_poller_waits_for_one_conversion():
+    buses = [
+        SimulatedBus(factory=lambda address: SimulatedBME280(seed=address))
+        for _ in range(2)
+    ]
+    sensors = [
+        (i, i % 2, Adafruit_BME280_I2C(buses[i % 2], 0x08 + i)) for i in range(8)
+    ]
+    poller = Poller(sensors)
+    try:
+        poller.sample()
+        start = time.perf_counter()
+        readings = poller.sample()
+        elapsed = time.perf_counter() - start
+    finally:
+        poller.executor.shutdown()
+
+    assert sorted(reading.sensor for reading in readings) == list(range(8))
+    # In sequence the sweep would take 8 conversions
+    assert elapsed < 2 * poller.conversion_time / 1000
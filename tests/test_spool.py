@@ -0,0 +1,163 @@
+import os
+from datetime import datetime, timezone
+from unittest import mock
+
+import pytest
+
+from thermnet.spool import RECORD_SIZE, Spool
+from thermnet.storage import Reading
+
+
+class Crash(BaseException):
+    """Stands for the process dying, nothing may catch it"""
+
+
+def reading(i):
+    return Reading(
+        datetime.fromtimestamp(1600000000 + i, timezone.utc),
+        i % 3,
+        {1: float(i), 2: 1000.0 + i, 3: 50.0},
+    )
+
+
+def temperatures(readings):
+    return [reading.values[1] for reading in readings]
+
+
+def pending(directory, max_records=10):
+    spool = Spool(directory, max_records * RECORD_SIZE)
+    try:
+        readings, _ = spool.read(100)
+        return temperatures(readings)
+    finally:
+        spool.close()
+
+
+@pytest.fixture
+def spool(tmp_path):
+    spool = Spool(tmp_path, 10 * RECORD_SIZE)
+    yield spool
+    spool.close()
+
+
+def test_append_read_commit(spool):
+    spool.append([reading(i) for i in range(4)])
+    assert len(spool) == 4
+
+    readings, offset = spool.read(3)
+    assert temperatures(readings) == [0.0, 1.0, 2.0]
+    assert readings[1].time == reading(1).time
+    assert readings[1].sensor == 1
+    spool.commit(offset)
+
+    readings, offset = spool.read(3)
+    assert temperatures(readings) == [3.0]
+    spool.commit(offset)
+    assert len(spool) == 0
+    assert spool.read(3) == ([], None)
+
+    # Offsets stay valid after the emptied file was reset
+    spool.append([reading(4)])
+    readings, offset = spool.read(3)
+    assert temperatures(readings) == [4.0]
+    spool.commit(offset)
+    assert len(spool) == 0
+
+
+def test_aggregated_readings_keep_stats(spool):
+    aggregate = reading(0)
+    aggregate.stats = {
+        quantity: (value - 1, value + 1, value * 4, 4)
+        for quantity, value in aggregate.values.items()
+    }
+    spool.append([aggregate])
+
+    (restored,), _ = spool.read(1)
+    assert restored.stats == aggregate.stats
+
+
+def test_compaction_during_read_in_flight(spool):
+    spool.append([reading(i) for i in range(8)])
+    readings, offset = spool.read(5)
+    assert temperatures(readings) == [0.0, 1.0, 2.0, 3.0, 4.0]
+
+    # Full, compacts down to the 8 records not yet committed, then appends
+    spool.append([reading(8), reading(9), reading(10)])
+    spool.commit(offset)
+
+    readings, _ = spool.read(100)
+    assert temperatures(readings) == [5.0, 6.0, 7.0, 8.0, 9.0, 10.0]
+
+
+def test_stale_offset_after_compaction_dropped_records(spool):
+    spool.append([reading(i) for i in range(10)])
+    _, stale = spool.read(2)
+
+    # Nothing committed, the two oldest readings are dropped to make room
+    spool.append([reading(10), reading(11)])
+    spool.commit(stale)
+
+    readings, _ = spool.read(100)
+    assert temperatures(readings) == [float(i) for i in range(2, 12)]
+
+
+def test_reopen_keeps_offset(tmp_path, spool):
+    spool.append([reading(i) for i in range(4)])
+    _, offset = spool.read(2)
+    spool.commit(offset)
+    spool.close()
+
+    assert pending(tmp_path) == [2.0, 3.0]
+
+
+def test_torn_tail_is_dropped(tmp_path, spool):
+    spool.append([reading(i) for i in range(3)])
+    spool.close()
+    (path,) = [name for name in os.listdir(tmp_path) if name.endswith(".spool")]
+    with open(tmp_path / path, "r+b") as f:
+        # A half written record, then a corrupt one before it
+        f.seek(0, os.SEEK_END)
+        f.write(b"\0" * (RECORD_SIZE // 2))
+        f.seek(2 * RECORD_SIZE + 4)
+        f.write(b"\xff")
+
+    assert pending(tmp_path) == [0.0, 1.0]
+
+
+def compact_with_crash(tmp_path, spool, target):
+    spool.append([reading(i) for i in range(8)])
+    _, offset = spool.read(5)
+    spool.commit(offset)
+    with mock.patch(target, side_effect=Crash):
+        with pytest.raises(Crash):
+            spool.append([reading(8), reading(9), reading(10)])
+    spool.close()
+    return pending(tmp_path)
+
+
+def test_crash_before_compaction_switch(tmp_path, spool):
+    # The new file is written but the offset still names the old one
+    remaining = compact_with_crash(
+        tmp_path, spool, "thermnet.spool.Spool._write_offset"
+    )
+    assert remaining == [5.0, 6.0, 7.0]
+    assert sorted(os.listdir(tmp_path)) == ["offset", "readings.0.spool"]
+
+
+def test_crash_after_compaction_switch(tmp_path, spool):
+    # The offset names the new file, the old one is still around
+    remaining = compact_with_crash(tmp_path, spool, "thermnet.spool.os.remove")
+    assert remaining == [5.0, 6.0, 7.0]
+    assert sorted(os.listdir(tmp_path)) == ["offset", "readings.1.spool"]
+
+
+def test_crash_while_resetting_empty_spool(tmp_path, spool):
+    spool.append([reading(i) for i in range(3)])
+    _, offset = spool.read(3)
+    # Truncated, but the offset past the new end is never written
+    with mock.patch.object(Spool, "_write_offset", side_effect=Crash):
+        with pytest.raises(Crash):
+            spool.commit(offset)
+    spool.close()
+
+    assert pending(tmp_path) == []
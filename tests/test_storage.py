@@ -0,0 +1,29 @@
+from datetime import datetime, timezone
+
+from sqlalchemy.dialects import postgresql
+
+from thermnet.storage import Reading, upsert_rollups
+
+
+def test_upsert_rollups_folds_buckets():
+    readings = [
+        Reading(datetime(2024, 1, 1, 0, 0, 30, tzinfo=timezone.utc), 1, {1: 20.0}),
+        Reading(datetime(2024, 1, 1, 0, 1, 10, tzinfo=timezone.utc), 1, {1: 22.0}),
+        Reading(
+            datetime(2024, 1, 1, 0, 1, 20, tzinfo=timezone.utc),
+            1,
+            {1: 21.0},
+            {1: (19.0, 23.0, 84.0, 4)},
+        ),
+    ]
+    params = upsert_rollups(readings).compile(dialect=postgresql.dialect()).params
+
+    minute = datetime(2024, 1, 1, 0, 1, tzinfo=timezone.utc)
+    hour = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    rows = list(zip(*(params[name] for name in ("resolution", "bucket"))))
+    assert rows == [(60, hour), (60, minute), (900, hour), (3600, hour)]
+    assert params["min"] == [20.0, 19.0, 19.0, 19.0]
+    assert params["max"] == [20.0, 23.0, 23.0, 23.0]
+    assert params["sum"] == [20.0, 106.0, 126.0, 126.0]
+    assert params["count"] == [1, 5, 6, 6]
+    assert params["sensor"] == params["quantity"] == [1, 1, 1, 1]
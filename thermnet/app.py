@@ -1,81 +1,216 @@
 import argparse
 import asyncio
 import configparser
+import json
 import logging
-from datetime import datetime
-from itertools import groupby
+import math
+import multiprocessing
+import signal
+from datetime import datetime, timedelta, timezone
 from json.decoder import JSONDecodeError
-
-from aiohttp import web
-from sqlalchemy import create_engine
-from sqlalchemy.sql import text
-
+from time import perf_counter
+
+from aiohttp import WSCloseCode, WSMsgType, web
+from aiopg.sa import create_engine
+
+from thermnet.auth import SecretCache
+from thermnet.dashboard import Dashboard, Subscriber
+from thermnet.encoding import ENCODINGS
+from thermnet.history import (
+    RAW_INTERVAL,
+    Bucketer,
+    bucket_width,
+    pick_resolution,
+    select_series,
+)
 from thermnet.logging import setup_logging
+from thermnet.metrics import CONTENT_TYPE, Counter, Gauge, Histogram, Registry
+from thermnet.notify import LocalBus, PostgresBus
+from thermnet.storage import (
+    COLUMNS,
+    QUANTITIES,
+    ROLLUP_RESOLUTIONS,
+    Reading,
+    check_time,
+    parse_time,
+    parse_values,
+    write_readings,
+)
+from thermnet.writer import QueueFull, WriteBehind
 
 routes = web.RouteTableDef()
 
+DAY = timedelta(hours=24)
+DEFAULT_MAX_POINTS = 1000
+MAX_POINTS = 10000
+SERIES_CHUNK = 256
+MAX_SUBSCRIPTIONS = 64
+
+metrics = Registry()
+INGEST_REQUESTS = Counter(
+    metrics, "thermnet_ingest_requests_total", "Ingest requests", ["endpoint"]
+)
+INGEST_READINGS = Counter(
+    metrics, "thermnet_ingest_readings_total", "Readings accepted for storage"
+)
+INGEST_REJECTED = Counter(
+    metrics,
+    "thermnet_ingest_rejected_total",
+    "Readings refused because the write-behind queue was full",
+)
+DB_LATENCY = Histogram(
+    metrics,
+    "thermnet_db_seconds",
+    "Duration of database operations, secret lookups mostly hit the cache",
+    ["operation"],
+)
+DB_POOL = Gauge(
+    metrics, "thermnet_db_pool_connections", "Database pool connections", ["state"]
+)
+BROADCAST = Histogram(
+    metrics,
+    "thermnet_broadcast_seconds",
+    "Time to apply stored readings to the dashboard and wake up its clients",
+)
+DASHBOARD_UPDATES = Histogram(
+    metrics,
+    "thermnet_dashboard_updates_seconds",
+    "Time to collect the pending updates of a client, encoding included",
+)
+WS_SEND = Histogram(
+    metrics,
+    "thermnet_websocket_send_seconds",
+    "Time to send a client the updates collected at one wakeup",
+)
+WS_CONNECTIONS = Gauge(
+    metrics, "thermnet_websocket_connections", "Connected dashboard clients"
+)
+WRITER_PENDING = Gauge(
+    metrics, "thermnet_writer_pending_readings", "Readings waiting to be written"
+)
+WRITER_BATCHES = Counter(
+    metrics, "thermnet_writer_batches_total", "Batches written by the write-behind"
+)
+WRITER_WRITTEN = Counter(
+    metrics, "thermnet_writer_readings_total", "Readings written by the write-behind"
+)
+WRITER_DEAD_LETTERED = Counter(
+    metrics,
+    "thermnet_writer_dead_lettered_total",
+    "Readings the write-behind dropped because the database rejected them",
+)
+WRITER_BATCH_SIZE = Histogram(
+    metrics,
+    "thermnet_writer_batch_readings",
+    "Readings written per write-behind flush",
+    buckets=(1, 10, 50, 100, 250, 500, 1000, 2500, 5000),
+)
+WRITER_LAST_FLUSH = Gauge(
+    metrics, "thermnet_writer_last_flush_seconds", "Duration of the last flush"
+)
+WRITER_MAX_FLUSH = Gauge(
+    metrics, "thermnet_writer_max_flush_seconds", "Duration of the slowest flush"
+)
+
 parser = argparse.ArgumentParser()
 parser.add_argument("--config", default="/etc/thermnet/thermnet.ini")
 parser.add_argument("--host", default="localhost")
 parser.add_argument("--port", default=8081, type=int)
+parser.add_argument("--workers", default=1, type=int)
 
 config = configparser.ConfigParser()
 config.read_dict(
     {
-        "db": {"url": "postgresql://thermnet@localhost/thermnet"},
+        "db": {
+            "url": "postgresql://thermnet@localhost/thermnet",
+            "pool_min_size": "1",
+            "pool_max_size": "10",
+        },
+        "auth": {"secret_cache_ttl": "300"},
+        "ingest": {
+            "write_behind": "no",
+            "max_pending": "10000",
+            "batch_size": "500",
+            "flush_interval": "1.0",
+            "drain_timeout": "10.0",
+            "max_clock_skew": "300",
+            "max_age_days": "0",
+        },
+        "websocket": {"send_timeout": "10.0", "notify": "local"},
         "logging": {"level": "INFO"},
     }
 )
 
 
-async def get_payload(app):
-    with app["sql_engine"].connect() as conn:
-        quantities = {
-            id: {"name": name, "unit": unit}
-            for id, name, unit in conn.execute(
-                text("""SELECT id, name, unit FROM quantities""")
-            )
-        }
-        measurements = conn.execute(
-            text(
-                """
-                SELECT id, time, value, sensor, quantity FROM measurements
-                WHERE sensor = 0 AND time BETWEEN NOW() - INTERVAL '24 HOURS' AND NOW()
-                ORDER BY time
-                """
-            )
-        )
+async def create_sqlalchemy(app):
+    app["sql_engine"] = await create_engine(
+        app["db_url"],
+        minsize=app["db_pool_min_size"],
+        maxsize=app["db_pool_max_size"],
+    )
 
-        app["logger"].info("Fetched payload")
-
-        def q_key(x):
-            return x[4]
-
-        return [
-            {
-                "name": quantities[quantity]["name"],
-                "unit": quantities[quantity]["unit"],
-                "measurements": [
-                    {"index": int(round(x[1].timestamp())), "value": x[2]}
-                    for x in measurements
-                ],
-            }
-            for quantity, measurements in groupby(
-                sorted(measurements, key=q_key), key=q_key
-            )
-        ]
+
+async def init_payload(app):
+    app["dashboard"] = Dashboard()
+    with DB_LATENCY.labels("seed").time():
+        async with app["sql_engine"].acquire() as conn:
+            await app["dashboard"].seed(conn)
+
+
+async def init_notify(app):
+    if app["notify"] == "postgres":
+        app["bus"] = PostgresBus(app["sql_engine"])
+    elif app["notify"] == "local":
+        app["bus"] = LocalBus()
+    else:
+        raise ValueError(f"Unknown notify bus: {app['notify']}")
+    app["bus_listener"] = asyncio.ensure_future(
+        app["bus"].listen(lambda readings: apply_readings(app, readings))
+    )
 
 
-async def create_sqlalchemy(app):
-    app["sql_engine"] = create_engine(app["db_url"])
+async def stop_notify(app):
+    app["bus_listener"].cancel()
 
 
-async def init_payload(app):
-    app["current_cond"] = asyncio.Condition()
+async def init_secrets(app):
+    app["secrets"] = SecretCache(app["secret_cache_ttl"])
+    app["secrets_listener"] = asyncio.ensure_future(
+        app["secrets"].listen(app["sql_engine"])
+    )
+    asyncio.get_event_loop().add_signal_handler(
+        signal.SIGHUP, app["secrets"].invalidate
+    )
+
+
+async def stop_secrets(app):
+    app["secrets_listener"].cancel()
+
+
+async def init_writer(app):
+    if not app["write_behind"]:
+        app["writer"] = None
+        return
+    app["writer"] = WriteBehind(
+        app["sql_engine"],
+        app["bus"],
+        max_pending=app["write_behind_max_pending"],
+        batch_size=app["write_behind_batch_size"],
+        flush_interval=app["write_behind_flush_interval"],
+        flush_seconds=DB_LATENCY.labels("flush"),
+        batch_sizes=WRITER_BATCH_SIZE,
+    )
+    app["writer"].start()
+
+
+async def drain_writer(app):
+    if app["writer"] is not None:
+        await app["writer"].close(app["write_behind_drain_timeout"])
 
 
 async def dispose_sqlalchemy(app):
-    app["sql_engine"].dispose()
+    app["sql_engine"].close()
+    await app["sql_engine"].wait_closed()
 
 
 @routes.post("/measurements/")
@@ -85,88 +220,413 @@ async def measurements(request: web.Request):
     except JSONDecodeError as e:
         raise web.HTTPBadRequest(reason=f"JSON decode error: {e}")
 
-    logging.info(f"Got request: {data}")
+    INGEST_REQUESTS.labels("single").inc()
 
     try:
-        with request.app["sql_engine"].connect() as conn:
-            sensor_result = conn.execute(
-                text("SELECT id FROM sensors WHERE secret = :secret"),
-                secret=data["secret"],
-            )
-            sensor_id = next(sensor_result)[0]
+        secret = data["secret"]
     except KeyError as e:
         raise web.HTTPBadRequest(reason=f"Key error: {e}")
-    except StopIteration:
+    except TypeError:
+        raise web.HTTPBadRequest(reason="Expected a JSON object")
+    if not isinstance(secret, str):
+        raise web.HTTPBadRequest(reason="Invalid secret")
+
+    with DB_LATENCY.labels("secret_lookup").time():
+        sensor_id = await request.app["secrets"].lookup(
+            request.app["sql_engine"], secret
+        )
+    if sensor_id is None:
         raise web.HTTPUnauthorized()
 
-    logging.info(f"Selected sensor: {sensor_id}")
+    logging.debug(f"Selected sensor: {sensor_id}")
 
     try:
-        with request.app["sql_engine"].connect() as conn:
-            conn.execute(
-                text(
-                    """
-                    INSERT INTO measurements (time, value, sensor, quantity) VALUES
-                    (:time, :temperature, :sensor, 1),
-                    (:time, :pressure, :sensor, 2),
-                    (:time, :humidity, :sensor, 3)
-                """
-                ),
-                time=datetime.utcnow(),
-                sensor=sensor_id,
-                temperature=data["temperature"],
-                pressure=data["pressure"],
-                humidity=data["humidity"],
+        reading = Reading(
+            datetime.utcnow().replace(tzinfo=timezone.utc),
+            sensor_id,
+            parse_values({name: data[name] for name in QUANTITIES}),
+        )
+    except KeyError as e:
+        raise web.HTTPBadRequest(reason=f"Key error: {e}")
+    except ValueError as e:
+        raise web.HTTPBadRequest(reason=f"Invalid reading: {e}")
+
+    await store_readings(request.app, [reading])
+
+    return web.Response(status=200)
+
+
+@routes.post("/measurements/batch/")
+async def measurements_batch(request: web.Request):
+    try:
+        data = await request.json()
+    except JSONDecodeError as e:
+        raise web.HTTPBadRequest(reason=f"JSON decode error: {e}")
+
+    INGEST_REQUESTS.labels("batch").inc()
+
+    now = datetime.now(timezone.utc)
+    max_skew = request.app["ingest_max_clock_skew"]
+    max_age = request.app["ingest_max_age"]
+    try:
+        batches = [(batch["secret"], batch["readings"]) for batch in data["sensors"]]
+        readings = [
+            (
+                secret,
+                check_time(parse_time(reading["time"]), now, max_skew, max_age),
+                parse_values(reading),
             )
-        async with request.app["current_cond"]:
-            request.app["current_cond"].notify_all()
+            for secret, batch_readings in batches
+            for reading in batch_readings
+        ]
+    except KeyError as e:
+        raise web.HTTPBadRequest(reason=f"Key error: {e}")
+    except (TypeError, ValueError, OverflowError) as e:
+        raise web.HTTPBadRequest(reason=f"Invalid reading: {e}")
+
+    logging.debug(f"Got batch of {len(readings)} readings from {len(batches)} sensors")
 
+    if not readings:
+        return web.json_response({"inserted": 0})
+
+    sensor_ids = {}
+    for secret, _ in batches:
+        if not isinstance(secret, str):
+            raise web.HTTPBadRequest(reason="Invalid secret")
+        with DB_LATENCY.labels("secret_lookup").time():
+            sensor_id = await request.app["secrets"].lookup(
+                request.app["sql_engine"], secret
+            )
+        if sensor_id is None:
+            raise web.HTTPUnauthorized()
+        sensor_ids[secret] = sensor_id
+
+    readings = [
+        Reading(time, sensor_ids[secret], values) for secret, time, values in readings
+    ]
+
+    await store_readings(request.app, readings)
+
+    return web.json_response({"inserted": len(readings)})
+
+
+async def store_readings(app, readings):
+    if app["writer"] is not None:
+        try:
+            app["writer"].put(readings)
+        except QueueFull:
+            INGEST_REJECTED.inc(len(readings))
+            raise web.HTTPServiceUnavailable(reason="Ingest queue full")
+    else:
+        # Other workers only hear of readings that were committed, with
+        # write-behind the writer notifies them along with each batch
+        stmts = write_readings(readings) + app["bus"].statements(readings)
+        with DB_LATENCY.labels("insert").time():
+            async with app["sql_engine"].acquire() as conn:
+                async with conn.begin():
+                    for stmt in stmts:
+                        await conn.execute(stmt)
+        await app["bus"].committed(readings)
+    INGEST_READINGS.inc(len(readings))
+
+    apply_readings(app, readings)
+
+
+def apply_readings(app, readings):
+    """Add readings stored by this or another worker to the dashboard"""
+    with BROADCAST.time():
+        for reading in readings:
+            app["dashboard"].append(reading.sensor, reading.time, reading.values)
+        app["dashboard"].publish({reading.sensor for reading in readings})
+
+
+def query_time(value):
+    try:
+        return parse_time(float(value))
+    except ValueError:
+        return parse_time(value)
+
+
+def query_quantity(value):
+    quantity = QUANTITIES[value] if value in QUANTITIES else int(value)
+    if quantity not in COLUMNS:
+        raise ValueError(f"Unknown quantity: {value}")
+    return quantity
+
+
+def query_resolution(value):
+    if value == "raw":
+        return None
+    resolution = int(value)
+    if resolution not in ROLLUP_RESOLUTIONS:
+        raise ValueError(f"Resolution must be raw or one of {ROLLUP_RESOLUTIONS}")
+    return resolution
+
+
+@routes.get("/sensors/{sensor}/series")
+async def series(request: web.Request):
+    """
+    Points of one quantity of a sensor between `from` and `to` (last 24 hours
+    by default). Without `resolution` the range is bucketed into at most
+    `max_points` points, with it rows of that resolution are returned a page of
+    `max_points` at a time, `next` being the `cursor` of the following page.
+    Cursors carry the full precision of the row times, as UTC in ISO 8601.
+    """
+    query = request.query
+    try:
+        sensor = int(request.match_info["sensor"])
+        quantity = query_quantity(query["quantity"])
+        end = query_time(query["to"]) if "to" in query else datetime.now(timezone.utc)
+        start = query_time(query["from"]) if "from" in query else end - DAY
+        max_points = int(query.get("max_points", DEFAULT_MAX_POINTS))
+        after = query_time(query["cursor"]) if "cursor" in query else None
+        paginate = "resolution" in query
+        if paginate:
+            resolution = query_resolution(query["resolution"])
     except KeyError as e:
         raise web.HTTPBadRequest(reason=f"Key error: {e}")
+    except (TypeError, ValueError, OverflowError) as e:
+        raise web.HTTPBadRequest(reason=f"Invalid parameter: {e}")
+
+    if not 2 <= max_points <= MAX_POINTS:
+        raise web.HTTPBadRequest(reason=f"max_points must be in [2, {MAX_POINTS}]")
+    if start >= end:
+        raise web.HTTPBadRequest(reason="from must be earlier than to")
+
+    if paginate:
+        bucketer = None
+        stmt = select_series(sensor, quantity, start, end, resolution, after)
+        stmt = stmt.limit(max_points + 1)
+    else:
+        resolution = pick_resolution(start, end, max_points)
+        step = resolution or RAW_INTERVAL
+        width = bucket_width(start, end, max_points)
+        bucketer = Bucketer(max(step, math.ceil(width / step) * step))
+        stmt = select_series(sensor, quantity, start, end, resolution, after)
+
+    response = web.StreamResponse(headers={"Content-Type": "application/json"})
+    await response.prepare(request)
+    header = {
+        "sensor": sensor,
+        "quantity": quantity,
+        "resolution": resolution or "raw",
+        "bucket": bucketer.width if bucketer else resolution or "raw",
+    }
+    await response.write(json.dumps(header)[:-1].encode() + b', "points": [')
+
+    chunk = []
+    separator = b""
+    written = 0
+    last_time = None
+    next_cursor = None
+
+    async def write_chunk():
+        nonlocal separator
+        if chunk:
+            await response.write(separator + ", ".join(chunk).encode())
+            separator = b", "
+            chunk.clear()
+
+    async def write_point(point):
+        nonlocal written
+        chunk.append(json.dumps(point))
+        written += 1
+        if len(chunk) >= SERIES_CHUNK:
+            await write_chunk()
+
+    async with request.app["sql_engine"].acquire() as conn:
+        async for time, min_, avg, max_, count in await conn.execute(stmt):
+            if bucketer is None:
+                if written == max_points:
+                    # Whole seconds would repeat the last point of the page
+                    # when its time has a fraction, naive times parse as UTC
+                    next_cursor = (
+                        last_time.astimezone(timezone.utc)
+                        .replace(tzinfo=None)
+                        .isoformat()
+                    )
+                    break
+                last_time = time
+                await write_point(
+                    {
+                        "index": int(time.timestamp()),
+                        "min": min_,
+                        "avg": avg,
+                        "max": max_,
+                    }
+                )
+                continue
+            point = bucketer.add(time, min_, avg, max_, count)
+            if point is not None:
+                await write_point(point)
+
+    if bucketer is not None:
+        point = bucketer.finish()
+        if point is not None:
+            await write_point(point)
+
+    await write_chunk()
+    await response.write(f'], "next": {json.dumps(next_cursor)}}}'.encode())
+    await response.write_eof()
+    return response
 
-    return web.Response(status=200)
+
+def query_sensors(value):
+    return {int(sensor) for sensor in value.split(",") if sensor}
+
+
+async def send_updates(ws, dashboard, subscriber, timeout):
+    while True:
+        await subscriber.wakeup.wait()
+        with DASHBOARD_UPDATES.time():
+            messages = dashboard.pending(subscriber)
+        start = perf_counter()
+        for message in messages:
+            send = ws.send_bytes if isinstance(message, bytes) else ws.send_str
+            try:
+                await asyncio.wait_for(send(message), timeout)
+            except asyncio.TimeoutError:
+                logging.warning("WebSocket client is not keeping up, disconnecting")
+                await ws.close(
+                    code=WSCloseCode.TRY_AGAIN_LATER, message=b"Send timeout"
+                )
+                return
+            except ConnectionResetError:
+                # The client went away, the handler cleans up
+                return
+        WS_SEND.observe(perf_counter() - start)
 
 
 @routes.get("/ws/")
 async def websocket_handler(request):
-    ws = web.WebSocketResponse()
+    """
+    Dashboard updates of the sensors given in `sensors` (sensor 0 by default),
+    clients change the set with {"type": "subscribe", "sensors": [...]}.
+    Snapshots are encoded as per the first WebSocket subprotocol offered out
+    of thermnet-binary, thermnet-columnar and thermnet-json, the default.
+    """
+    try:
+        sensors = query_sensors(request.query.get("sensors", "0"))
+    except ValueError as e:
+        raise web.HTTPBadRequest(reason=f"Invalid sensors: {e}")
+    if len(sensors) > MAX_SUBSCRIPTIONS:
+        raise web.HTTPBadRequest(reason=f"At most {MAX_SUBSCRIPTIONS} sensors")
+
+    # Unknown IDs are dropped so that clients cannot make the dashboard keep
+    # state for sensors that do not exist
+    secrets, engine = request.app["secrets"], request.app["sql_engine"]
+    sensors = await secrets.known(engine, sensors)
+
+    ws = web.WebSocketResponse(protocols=tuple(ENCODINGS))
     await ws.prepare(request)
 
+    # All sends happen in the sender task, a stalled client only ever holds
+    # its own coroutine and at most one pending update per followed sensor
+    dashboard = request.app["dashboard"]
+    subscriber = Subscriber(ENCODINGS.get(ws.ws_protocol, "json"))
+    dashboard.subscribe(subscriber, sensors)
+    sender = asyncio.ensure_future(
+        send_updates(ws, dashboard, subscriber, request.app["ws_send_timeout"])
+    )
+    WS_CONNECTIONS.inc()
+
     try:
-        while True:
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                continue
             try:
-                payload = await get_payload(request.app)
-            except Exception as e:
-                logging.warning(f"Error while fetching payload: {e}")
+                message = json.loads(msg.data)
+            except JSONDecodeError:
+                continue
+            if not isinstance(message, dict):
                 continue
 
-            await ws.send_json(payload)
-            async with request.app["current_cond"]:
-                await request.app["current_cond"].wait()
+            if message.get("type") == "subscribe":
+                try:
+                    sensors = {int(sensor) for sensor in message["sensors"]}
+                except (KeyError, TypeError, ValueError):
+                    continue
+                if len(sensors) <= MAX_SUBSCRIPTIONS:
+                    sensors = await secrets.known(engine, sensors)
+                    dashboard.subscribe(subscriber, sensors)
+            elif message.get("type") == "resync":
+                logging.info("Client requested resync")
+                dashboard.resync(subscriber, message.get("sensor", 0))
     finally:
+        WS_CONNECTIONS.dec()
+        sender.cancel()
+        dashboard.unsubscribe(subscriber)
         await ws.close()
         return ws
 
 
+@routes.get("/metrics")
+async def metrics_endpoint(request):
+    """Server metrics in the Prometheus text format"""
+    engine = request.app["sql_engine"]
+    DB_POOL.labels("used").set(engine.size - engine.freesize)
+    DB_POOL.labels("free").set(engine.freesize)
+    DB_POOL.labels("max").set(engine.maxsize)
+
+    writer = request.app["writer"]
+    if writer is not None:
+        WRITER_PENDING.set(len(writer.pending))
+        WRITER_BATCHES.set_total(writer.batches)
+        WRITER_WRITTEN.set_total(writer.written)
+        WRITER_DEAD_LETTERED.set_total(writer.dead_lettered)
+        WRITER_LAST_FLUSH.set(writer.last_flush_latency)
+        WRITER_MAX_FLUSH.set(writer.max_flush_latency)
+
+    return web.Response(
+        body=metrics.render().encode(), headers={"Content-Type": CONTENT_TYPE}
+    )
+
+
 async def app(config_path="/etc/thermnet/thermnet.ini"):
-    config.read(config)
+    config.read(config_path)
     setup_logging(config["logging"]["level"])
 
     application = web.Application()
 
     application["db_url"] = config["db"]["url"]
+    application["db_pool_min_size"] = config["db"].getint("pool_min_size")
+    application["db_pool_max_size"] = config["db"].getint("pool_max_size")
+    application["secret_cache_ttl"] = config["auth"].getfloat("secret_cache_ttl")
+    application["write_behind"] = config["ingest"].getboolean("write_behind")
+    application["write_behind_max_pending"] = config["ingest"].getint("max_pending")
+    application["write_behind_batch_size"] = config["ingest"].getint("batch_size")
+    application["write_behind_flush_interval"] = config["ingest"].getfloat(
+        "flush_interval"
+    )
+    application["write_behind_drain_timeout"] = config["ingest"].getfloat(
+        "drain_timeout"
+    )
+    # Far-future times would stay the dashboard's current value indefinitely
+    application["ingest_max_clock_skew"] = timedelta(
+        seconds=config["ingest"].getfloat("max_clock_skew")
+    )
+    max_age_days = config["ingest"].getint("max_age_days")
+    application["ingest_max_age"] = (
+        timedelta(days=max_age_days) if max_age_days else None
+    )
+    application["ws_send_timeout"] = config["websocket"].getfloat("send_timeout")
+    application["notify"] = config["websocket"]["notify"]
 
     application.add_routes(routes)
     application.on_startup.append(create_sqlalchemy)
     application.on_startup.append(init_payload)
+    application.on_startup.append(init_notify)
+    application.on_startup.append(init_secrets)
+    application.on_startup.append(init_writer)
+    application.on_cleanup.append(stop_notify)
+    application.on_cleanup.append(stop_secrets)
+    application.on_cleanup.append(drain_writer)
     application.on_cleanup.append(dispose_sqlalchemy)
 
     return application
 
 
-if __name__ == "__main__":
-    args = parser.parse_args()
-
+def serve(args):
     web.run_app(
         app(args.config),
         host=args.host,
@@ -174,3 +634,23 @@ if __name__ == "__main__":
         reuse_address=True,
         reuse_port=True,
     )
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    # Workers share the port and, over Postgres, dashboard updates. With the
+    # local bus each worker's dashboards would miss the others' readings.
+    config.read(args.config)
+    if args.workers > 1 and config["websocket"]["notify"] != "postgres":
+        parser.error("--workers above 1 requires [websocket] notify = postgres")
+
+    workers = [
+        multiprocessing.Process(target=serve, args=(args,))
+        for _ in range(args.workers - 1)
+    ]
+    for worker in workers:
+        worker.start()
+    serve(args)
+    for worker in workers:
+        worker.join()
@@ -0,0 +1,82 @@
+import asyncio
+import hashlib
+import hmac
+import logging
+from time import monotonic
+
+from sqlalchemy.sql import text
+
+CHANNEL = "thermnet_sensors"
+
+
+def _digest(secret):
+    return hashlib.sha256(secret.encode()).digest()
+
+
+class SecretCache:
+    """
+    Sensor secret to ID mapping held in memory, reloaded from the database
+    every `ttl` seconds or after `invalidate()`
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._sensors = {}
+        self._ids = frozenset()
+        self._expires = 0.0
+        self._lock = asyncio.Lock()
+
+    def invalidate(self):
+        self._expires = 0.0
+
+    async def reload(self, engine):
+        async with engine.acquire() as conn:
+            sensors = {
+                _digest(secret): (secret.encode(), id)
+                async for id, secret in await conn.execute(
+                    text("SELECT id, secret FROM sensors")
+                )
+            }
+        self._sensors = sensors
+        self._ids = frozenset(id for _, id in sensors.values())
+        self._expires = monotonic() + self.ttl
+        logging.info(f"Loaded {len(sensors)} sensor secrets")
+
+    async def _refresh(self, engine):
+        if monotonic() >= self._expires:
+            async with self._lock:
+                if monotonic() >= self._expires:
+                    await self.reload(engine)
+
+    async def lookup(self, engine, secret):
+        """ID of the sensor owning `secret` or None"""
+        await self._refresh(engine)
+
+        # The digest only selects the candidate, the secret itself is
+        # compared in constant time
+        candidate = self._sensors.get(_digest(secret))
+        if candidate is None or not hmac.compare_digest(candidate[0], secret.encode()):
+            return None
+        return candidate[1]
+
+    async def known(self, engine, sensors):
+        """The IDs out of `sensors` that belong to existing sensors"""
+        await self._refresh(engine)
+        return set(sensors) & self._ids
+
+    async def listen(self, engine):
+        """Invalidate on every notification sent by the sensors table trigger"""
+        while True:
+            try:
+                async with engine.acquire() as conn:
+                    await conn.execute(f"LISTEN {CHANNEL}")
+                    while True:
+                        await conn.connection.notifies.get()
+                        logging.info("Sensors changed, invalidating secrets")
+                        self.invalidate()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning(f"Lost {CHANNEL} listener: {e}, retrying")
+                self.invalidate()
+                await asyncio.sleep(5)
@@ -134,8 +134,12 @@ class Adafruit_BME280:
     """Driver from BME280 Temperature, Humidity and Barometic Pressure sensor"""
 
     # pylint: disable=too-many-instance-attributes
-    def __init__(self):
-        """Check the BME280 was found, read the coefficients and enable the sensor"""
+    def __init__(self, calibration=None):
+        """
+        Check the BME280 was found, read the coefficients and enable the sensor.
+        A `calibration` previously taken from the same chip skips the soft reset
+        and the coefficient reads if it still matches the chip.
+        """
         # Check device ID.
         chip_id = self._read_byte(_BME280_REGISTER_CHIPID)
         if _BME280_CHIPID != chip_id:
@@ -147,8 +151,9 @@ class Adafruit_BME280:
         self._overscan_pressure = OVERSCAN_X16
         self._t_standby = STANDBY_TC_125
         self._mode = MODE_SLEEP
-        self._reset()
-        self._read_coefficients()
+        if not self._load_calibration(calibration):
+            self._reset()
+            self._read_coefficients()
         self._write_ctrl_meas()
         self._write_config()
         self.sea_level_pressure = 1013.25
@@ -157,14 +162,21 @@ class Adafruit_BME280:
 
     def _read_temperature(self):
         # perform one measurement
+        self._measure()
+        raw_temperature = (
+            self._read24(_BME280_REGISTER_TEMPDATA) / 16
+        )  # lowest 4 bits get dropped
+        self._compensate_temperature(raw_temperature)
+
+    def _measure(self):
+        """Trigger a forced conversion unless in normal mode and wait for it"""
         if self.mode != MODE_NORMAL:
             self.mode = MODE_FORCE
             # Wait for conversion to complete
             while self._get_status() & 0x08:
                 sleep(0.002)
-        raw_temperature = (
-            self._read24(_BME280_REGISTER_TEMPDATA) / 16
-        )  # lowest 4 bits get dropped
+
+    def _compensate_temperature(self, raw_temperature):
         # print("raw temp: ", UT)
         var1 = (
             raw_temperature / 16384.0 - self._temp_calib[0] / 1024.0
@@ -359,12 +371,14 @@ class Adafruit_BME280:
         returns None if pressure measurement is disabled
         """
         self._read_temperature()
-
-        # Algorithm from the BME280 driver
-        # https://github.com/BoschSensortec/BME280_driver/blob/master/bme280.c
         adc = (
             self._read24(_BME280_REGISTER_PRESSUREDATA) / 16
         )  # lowest 4 bits get dropped
+        return self._compensate_pressure(adc)
+
+    def _compensate_pressure(self, adc):
+        # Algorithm from the BME280 driver
+        # https://github.com/BoschSensortec/BME280_driver/blob/master/bme280.c
         var1 = float(self._t_fine) / 2.0 - 64000.0
         var2 = var1 * var1 * self._pressure_calib[5] / 32768.0
         var2 = var2 + var1 * self._pressure_calib[4] * 2.0
@@ -401,7 +415,9 @@ reading the calibration registers"
         # print("Humidity data: ", hum)
         adc = float(hum[0] << 8 | hum[1])
         # print("adc:", adc)
+        return self._compensate_humidity(adc)
 
+    def _compensate_humidity(self, adc):
         # Algorithm from the BME280 driver
         # https://github.com/BoschSensortec/BME280_driver/blob/master/bme280.c
         var1 = float(self._t_fine) - 76800.0
@@ -428,6 +444,43 @@ reading the calibration registers"
         # else...
         return humidity
 
+    def start_measurement(self):
+        """
+        Trigger a forced conversion without waiting for it, read the result
+        with `read_all(measure=False)` after `measurement_time_max`
+        """
+        if self.mode != MODE_NORMAL:
+            self.mode = MODE_FORCE
+
+    def read_raw(self, measure=True):
+        """
+        Raw temperature, pressure (24 bit data register contents) and humidity
+        (16 bit) from a single conversion, read in one 8 byte burst starting
+        at the pressure data register
+        """
+        if measure:
+            self._measure()
+        data = self._read_register(_BME280_REGISTER_PRESSUREDATA, 8)
+        return (
+            data[3] << 16 | data[4] << 8 | data[5],
+            data[0] << 16 | data[1] << 8 | data[2],
+            data[6] << 8 | data[7],
+        )
+
+    def read_all(self, measure=True):
+        """Temperature, pressure and humidity from a single conversion"""
+        return self.compensate_raw(*self.read_raw(measure))
+
+    def compensate_raw(self, raw_temperature, raw_pressure, raw_humidity):
+        """Compensated values of a `read_raw()` triple"""
+        # lowest 4 bits of temperature and pressure get dropped
+        self._compensate_temperature(float(raw_temperature) / 16)
+        return (
+            self._t_fine / 5120.0,
+            self._compensate_pressure(float(raw_pressure) / 16),
+            self._compensate_humidity(float(raw_humidity)),
+        )
+
     @property
     def altitude(self):
         """The altitude based on current ``pressure`` versus the sea level pressure
@@ -438,6 +491,7 @@ reading the calibration registers"
     def _read_coefficients(self):
         """Read & save the calibration coefficients"""
         coeff = self._read_register(_BME280_REGISTER_DIG_T1, 24)
+        self._calibration_check = bytes(coeff[:6]).hex()
         coeff = list(struct.unpack("<HhhHhhhhhhhh", bytes(coeff)))
         coeff = [float(i) for i in coeff]
         self._temp_calib = coeff[:3]
@@ -453,6 +507,40 @@ reading the calibration registers"
         self._humidity_calib[4] = float((coeff[4] << 4) | (coeff[3] >> 4))
         self._humidity_calib[5] = float(coeff[5])
 
+    def _read_calibration_check(self):
+        """First 6 calibration bytes (dig_T1 to dig_T3), cheap to compare"""
+        return bytes(self._read_register(_BME280_REGISTER_DIG_T1, 6)).hex()
+
+    @property
+    def calibration(self):
+        """Calibration coefficients to pass to a later instance for this chip"""
+        return {
+            "check": self._calibration_check,
+            "temperature": list(self._temp_calib),
+            "pressure": list(self._pressure_calib),
+            "humidity": list(self._humidity_calib),
+        }
+
+    def _load_calibration(self, calibration):
+        if not calibration:
+            return False
+        try:
+            check = calibration["check"]
+            temp_calib = [float(x) for x in calibration["temperature"]]
+            pressure_calib = [float(x) for x in calibration["pressure"]]
+            humidity_calib = [float(x) for x in calibration["humidity"]]
+        except (KeyError, TypeError, ValueError):
+            return False
+        if len(temp_calib) != 3 or len(pressure_calib) != 9:
+            return False
+        if len(humidity_calib) != 6 or self._read_calibration_check() != check:
+            return False
+        self._calibration_check = check
+        self._temp_calib = temp_calib
+        self._pressure_calib = pressure_calib
+        self._humidity_calib = humidity_calib
+        return True
+
     def _read_byte(self, register):
         """Read a byte register value and return it"""
         return self._read_register(register, 1)[0]
@@ -475,10 +563,10 @@ reading the calibration registers"
 class Adafruit_BME280_I2C(Adafruit_BME280):
     """Driver for BME280 connected over I2C"""
 
-    def __init__(self, i2c, address=_BME280_ADDRESS):
+    def __init__(self, i2c, address=_BME280_ADDRESS, calibration=None):
         self._i2c = i2c
         self.address = address
-        super().__init__()
+        super().__init__(calibration)
 
     def _read_register(self, register, length):
         return self._i2c.read_i2c_block_data(self.address, register, length)
@@ -492,11 +580,11 @@ class Adafruit_BME280_I2C(Adafruit_BME280):
 class Adafruit_BME280_SPI(Adafruit_BME280):
     """Driver for BME280 connected over SPI"""
 
-    def __init__(self, spi, cs, baudrate=100000):
+    def __init__(self, spi, cs, baudrate=100000, calibration=None):
         import adafruit_bus_device.spi_device as spi_device  # pylint: disable=import-outside-toplevel
 
         self._spi = spi_device.SPIDevice(spi, cs, baudrate=baudrate)
-        super().__init__()
+        super().__init__(calibration)
 
     def _read_register(self, register, length):
         register = (register | 0x80) & 0xFF  # Read single, bit 7 high.
@@ -511,3 +599,68 @@ class Adafruit_BME280_SPI(Adafruit_BME280):
         register &= 0x7F  # Write, bit 7 low.
         with self._spi as spi:
             spi.write(bytes([register, value & 0xFF]))  # pylint: disable=no-member
+
+
+def compensate_arrays(
+    raw_temperature,
+    raw_pressure,
+    raw_humidity,
+    temp_calib,
+    pressure_calib,
+    humidity_calib,
+):
+    """
+    Vectorized `Adafruit_BME280.compensate_raw()` over arrays of `read_raw()`
+    triples, given the driver's `_temp_calib`, `_pressure_calib` and
+    `_humidity_calib`. Requires NumPy. Every operation is done in the same
+    order and precision as in the scalar code so that results match it bit
+    for bit. Returns arrays of temperature, pressure and humidity.
+    """
+    import numpy as np  # pylint: disable=import-outside-toplevel
+
+    t_calib = [float(x) for x in temp_calib]
+    p_calib = [float(x) for x in pressure_calib]
+    h_calib = [float(x) for x in humidity_calib]
+
+    raw_temperature = np.asarray(raw_temperature, dtype=np.float64) / 16
+    var1 = (raw_temperature / 16384.0 - t_calib[0] / 1024.0) * t_calib[1]
+    var2 = (
+        (raw_temperature / 131072.0 - t_calib[0] / 8192.0)
+        * (raw_temperature / 131072.0 - t_calib[0] / 8192.0)
+    ) * t_calib[2]
+    t_fine = np.trunc(var1 + var2)
+    temperature = t_fine / 5120.0
+
+    adc = np.asarray(raw_pressure, dtype=np.float64) / 16
+    var1 = t_fine / 2.0 - 64000.0
+    var2 = var1 * var1 * p_calib[5] / 32768.0
+    var2 = var2 + var1 * p_calib[4] * 2.0
+    var2 = var2 / 4.0 + p_calib[3] * 65536.0
+    var3 = p_calib[2] * var1 * var1 / 524288.0
+    var1 = (var3 + p_calib[1] * var1) / 524288.0
+    var1 = (1.0 + var1 / 32768.0) * p_calib[0]
+    if not np.all(var1):  # avoid exception caused by division by zero
+        raise ArithmeticError(
+            "Invalid result possibly related to error while \
+reading the calibration registers"
+        )
+    pressure = 1048576.0 - adc
+    pressure = ((pressure - var2 / 4096.0) * 6250.0) / var1
+    var1 = p_calib[8] * pressure * pressure / 2147483648.0
+    var2 = pressure * p_calib[7] / 32768.0
+    pressure = pressure + (var1 + var2 + p_calib[6]) / 16.0
+    pressure /= 100
+    pressure = np.clip(pressure, _BME280_PRESSURE_MIN_HPA, _BME280_PRESSURE_MAX_HPA)
+
+    adc = np.asarray(raw_humidity, dtype=np.float64)
+    var1 = t_fine - 76800.0
+    var2 = h_calib[3] * 64.0 + (h_calib[4] / 16384.0) * var1
+    var3 = adc - var2
+    var4 = h_calib[1] / 65536.0
+    var5 = 1.0 + (h_calib[2] / 67108864.0) * var1
+    var6 = 1.0 + (h_calib[5] / 67108864.0) * var1 * var5
+    var6 = var3 * var4 * (var5 * var6)
+    humidity = var6 * (1.0 - h_calib[0] * var6 / 524288.0)
+    humidity = np.clip(humidity, _BME280_HUMIDITY_MIN, _BME280_HUMIDITY_MAX)
+
+    return temperature, pressure, humidity
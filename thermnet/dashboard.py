@@ -0,0 +1,248 @@
+import asyncio
+import json
+import logging
+from bisect import bisect_right
+from collections import defaultdict, deque
+from time import time
+
+from sqlalchemy.sql import text
+
+from thermnet.encoding import encode_snapshot
+from thermnet.storage import COLUMNS
+
+WINDOW = 24 * 3600
+PROTOCOL_VERSION = 1
+DELTA_HISTORY = 64
+
+
+class SeriesWindow:
+    """Points of one sensor/quantity pair no older than `span` seconds"""
+
+    def __init__(self, span=WINDOW):
+        self.span = span
+        self.points = deque()
+
+    def append(self, index, value):
+        if not self.points or index >= self.points[-1][0]:
+            self.points.append((index, value))
+            return
+        # Late readings (e.g. from buffered devices) are rare, keep them ordered
+        position = bisect_right(self.points, (index, float("inf")))
+        self.points.insert(position, (index, value))
+
+    def trim(self, now):
+        """Drop points older than `span`, True if there were any"""
+        trimmed = False
+        while self.points and self.points[0][0] < now - self.span:
+            self.points.popleft()
+            trimmed = True
+        return trimmed
+
+
+class Subscriber:
+    """
+    Sensors followed by one WebSocket client, the last update it got of each
+    and which of them changed since. Updates published while the client is
+    busy sending coalesce into the `dirty` set, so nothing queues up per
+    client beyond one entry per followed sensor. Snapshots are sent in the
+    `encoding` the client negotiated.
+    """
+
+    def __init__(self, encoding="json"):
+        self.encoding = encoding
+        self.seqs = {}
+        self.dirty = set()
+        self.wakeup = asyncio.Event()
+
+    def notify(self, sensor):
+        self.dirty.add(sensor)
+        self.wakeup.set()
+
+    def take_dirty(self):
+        dirty, self.dirty = self.dirty, set()
+        self.wakeup.clear()
+        return dirty
+
+
+class Dashboard:
+    """
+    In-memory copy of the last 24 hours of measurements, kept up to date on
+    ingest so that dashboard updates never have to query the database
+    """
+
+    def __init__(self, span=WINDOW, delta_history=DELTA_HISTORY):
+        self.span = span
+        self.quantities = {}
+        self.windows = {}
+        self._sensor_windows = {}
+        self.seqs = defaultdict(int)
+        self._deltas = defaultdict(lambda: deque(maxlen=delta_history))
+        self._payloads = {}
+        self._subscribers = defaultdict(set)
+
+    async def seed(self, conn):
+        self.quantities = {
+            id: {"name": name, "unit": unit}
+            async for id, name, unit in await conn.execute(
+                text("""SELECT id, name, unit FROM quantities""")
+            )
+        }
+        result = await conn.execute(
+            text(
+                f"""
+                SELECT time, sensor, {", ".join(COLUMNS.values())} FROM readings
+                WHERE time BETWEEN NOW() - INTERVAL '24 HOURS' AND NOW()
+                ORDER BY time
+                """
+            )
+        )
+        count = 0
+        async for time_, sensor, *values in result:
+            index = int(round(time_.timestamp()))
+            for quantity, value in zip(COLUMNS, values):
+                if value is not None:
+                    self._insert(sensor, index, quantity, value)
+            count += 1
+
+        logging.info(f"Seeded dashboard with {count} readings")
+
+    def _insert(self, sensor, index, quantity, value):
+        window = self.windows.get((sensor, quantity))
+        if window is None:
+            window = self.windows[(sensor, quantity)] = SeriesWindow(self.span)
+            self._sensor_windows.setdefault(sensor, []).append(window)
+        window.append(index, value)
+
+    def _expire(self, sensor, now):
+        """
+        Trim the windows of `sensor` and drop its cached snapshots if they
+        held any of the expired points
+        """
+        trimmed = False
+        for window in self._sensor_windows.get(sensor, ()):
+            trimmed |= window.trim(now)
+        if trimmed:
+            self._payloads.pop(sensor, None)
+
+    def append(self, sensor, time_, values):
+        """Add a reading, `values` maps quantity IDs to measured values"""
+        now = time()
+        index = int(round(time_.timestamp()))
+        if index < now - self.span:
+            return
+        for quantity, value in values.items():
+            self._insert(sensor, index, quantity, value)
+        self._expire(sensor, now)
+        self._payloads.pop(sensor, None)
+
+        self.seqs[sensor] += 1
+        delta = {
+            "type": "delta",
+            "version": PROTOCOL_VERSION,
+            "sensor": sensor,
+            "seq": self.seqs[sensor],
+            "append": [
+                {"quantity": quantity, "index": index, "value": value}
+                for quantity, value in sorted(values.items())
+            ],
+            "expire": int(now) - self.span,
+        }
+        self._deltas[sensor].append((self.seqs[sensor], json.dumps(delta)))
+
+    def snapshot(self, sensor, encoding="json"):
+        """Serialized full window of `sensor`, encoded once per update"""
+        self._expire(sensor, time())
+        if sensor not in self._sensor_windows:
+            # Nothing to cache for sensors that never sent a reading
+            return encode_snapshot(encoding, PROTOCOL_VERSION, sensor, 0, [])
+        payloads = self._payloads.setdefault(sensor, {})
+        if encoding not in payloads:
+            series = []
+            for (sensor_, quantity), window in sorted(self.windows.items()):
+                if sensor_ != sensor:
+                    continue
+                if not window.points:
+                    continue
+                quantity_info = self.quantities.get(
+                    quantity, {"name": str(quantity), "unit": ""}
+                )
+                series.append(
+                    (
+                        quantity,
+                        quantity_info["name"],
+                        quantity_info["unit"],
+                        window.points,
+                    )
+                )
+            payloads[encoding] = encode_snapshot(
+                encoding, PROTOCOL_VERSION, sensor, self.seqs.get(sensor, 0), series
+            )
+        return payloads[encoding]
+
+    def updates(self, sensor, since, encoding="json"):
+        """
+        Messages bringing a client that has seen update `since` up to date,
+        falls back to a snapshot when the deltas are no longer retained or
+        `since` is None. Deltas hold a handful of points and are JSON text
+        whatever the `encoding` of the snapshot.
+        """
+        deltas = self._deltas.get(sensor, ())
+        seq = self.seqs.get(sensor, 0)
+        if since == seq:
+            return []
+        if (
+            since is None
+            or since > seq
+            or not deltas
+            or deltas[0][0] > since + 1
+        ):
+            return [self.snapshot(sensor, encoding)]
+        return [message for seq, message in deltas if seq > since]
+
+    def subscribe(self, subscriber, sensors):
+        """
+        Make `subscriber` follow exactly `sensors`, the newly followed ones
+        get a snapshot on the next `pending()`
+        """
+        sensors = set(sensors)
+        for sensor in set(subscriber.seqs) - sensors:
+            subscribers = self._subscribers[sensor]
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[sensor]
+            del subscriber.seqs[sensor]
+
+        for sensor in sensors - set(subscriber.seqs):
+            self._subscribers[sensor].add(subscriber)
+            subscriber.seqs[sensor] = None
+            subscriber.notify(sensor)
+
+    def unsubscribe(self, subscriber):
+        self.subscribe(subscriber, ())
+
+    def publish(self, sensors):
+        """Wake up the subscribers of `sensors`"""
+        for sensor in sensors:
+            for subscriber in self._subscribers.get(sensor, ()):
+                subscriber.notify(sensor)
+
+    def pending(self, subscriber):
+        """
+        Messages bringing `subscriber` up to date with all its sensors, at most
+        one snapshot or `delta_history` deltas per sensor however far behind
+        the subscriber is
+        """
+        messages = []
+        for sensor in sorted(subscriber.take_dirty()):
+            if sensor not in subscriber.seqs:
+                continue
+            messages.extend(
+                self.updates(sensor, subscriber.seqs[sensor], subscriber.encoding)
+            )
+            subscriber.seqs[sensor] = self.seqs.get(sensor, 0)
+        return messages
+
+    def resync(self, subscriber, sensor):
+        if sensor in subscriber.seqs:
+            subscriber.seqs[sensor] = None
+            subscriber.notify(sensor)
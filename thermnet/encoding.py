@@ -0,0 +1,105 @@
+import json
+import struct
+
+# WebSocket subprotocols by encoding, clients asking for none get "json"
+SUBPROTOCOLS = {
+    "binary": "thermnet-binary",
+    "columnar": "thermnet-columnar",
+    "json": "thermnet-json",
+}
+ENCODINGS = {protocol: encoding for encoding, protocol in SUBPROTOCOLS.items()}
+
+SNAPSHOT = 1
+
+# Binary snapshot, all little-endian: message type, protocol version, series
+# count, sensor and seq, then per series its quantity, name and unit lengths
+# and point count, the name and unit in UTF-8 padded to a multiple of 4 bytes
+# and the points as int32 UNIX times followed by float32 values, so that both
+# arrays can be viewed in place as typed arrays
+_HEADER = struct.Struct("<BBHiI")
+_SERIES = struct.Struct("<HBBI")
+
+
+def _json_snapshot(version, sensor, seq, series):
+    return json.dumps(
+        {
+            "type": "snapshot",
+            "version": version,
+            "sensor": sensor,
+            "seq": seq,
+            "series": [
+                {
+                    "quantity": quantity,
+                    "name": name,
+                    "unit": unit,
+                    "measurements": [
+                        {"index": index, "value": value} for index, value in points
+                    ],
+                }
+                for quantity, name, unit, points in series
+            ],
+        }
+    )
+
+
+def _delta_times(points):
+    times = []
+    previous = 0
+    for index, _ in points:
+        times.append(index - previous)
+        previous = index
+    return times
+
+
+def _columnar_snapshot(version, sensor, seq, series):
+    return json.dumps(
+        {
+            "type": "snapshot",
+            "version": version,
+            "encoding": "columnar",
+            "sensor": sensor,
+            "seq": seq,
+            "series": [
+                {
+                    "quantity": quantity,
+                    "name": name,
+                    "unit": unit,
+                    # The first time is absolute, the rest are differences
+                    "times": _delta_times(points),
+                    "values": [value for _, value in points],
+                }
+                for quantity, name, unit, points in series
+            ],
+        },
+        separators=(",", ":"),
+    )
+
+
+def _binary_snapshot(version, sensor, seq, series):
+    parts = [_HEADER.pack(SNAPSHOT, version, len(series), sensor, seq)]
+    for quantity, name, unit, points in series:
+        name, unit = name.encode()[:255], unit.encode()[:255]
+        strings = name + unit
+        strings += bytes(-len(strings) % 4)
+        count = len(points)
+        parts.append(_SERIES.pack(quantity, len(name), len(unit), count))
+        parts.append(strings)
+        parts.append(struct.pack(f"<{count}i", *(index for index, _ in points)))
+        parts.append(struct.pack(f"<{count}f", *(value for _, value in points)))
+    return b"".join(parts)
+
+
+_SNAPSHOT_ENCODERS = {
+    "json": _json_snapshot,
+    "columnar": _columnar_snapshot,
+    "binary": _binary_snapshot,
+}
+
+
+def encode_snapshot(encoding, version, sensor, seq, series):
+    """
+    Snapshot message in `encoding`, text for the JSON ones and bytes for
+    "binary". `series` holds (quantity, name, unit, points) tuples, points
+    being (UNIX time, value) pairs in time order.
+    """
+    return _SNAPSHOT_ENCODERS[encoding](version, sensor, seq, series)
@@ -0,0 +1,102 @@
+import math
+
+import sqlalchemy as sa
+
+from thermnet.storage import (
+    COLUMNS,
+    ROLLUP_RESOLUTIONS,
+    measurement_rollups,
+    readings_table,
+)
+
+RAW_INTERVAL = 60
+
+
+def bucket_width(start, end, max_points):
+    """Seconds per point for at most `max_points` points between `start` and `end`"""
+    return math.ceil((end - start).total_seconds() / (max_points - 1))
+
+
+def pick_resolution(start, end, max_points):
+    """
+    Coarsest resolution no wider than the buckets of `max_points` points
+    between `start` and `end`, for the `Bucketer` to merge. None stands for
+    raw measurements.
+    """
+    width = bucket_width(start, end, max_points)
+    fitting = [resolution for resolution in ROLLUP_RESOLUTIONS if resolution <= width]
+    return fitting[-1] if fitting else None
+
+
+def select_series(sensor, quantity, start, end, resolution=None, after=None):
+    """
+    Rows of (time, min, avg, max, count) between `start` and `end` ordered by
+    time, only those later than `after` if given
+    """
+    if resolution is None:
+        time = readings_table.c.time
+        value = readings_table.c[COLUMNS[quantity]]
+        query = sa.select(
+            [
+                time.label("time"),
+                value.label("min"),
+                value.label("avg"),
+                value.label("max"),
+                sa.literal(1).label("count"),
+            ]
+        ).where(value.isnot(None))
+        query = query.where(readings_table.c.sensor == sensor)
+    else:
+        time = measurement_rollups.c.bucket
+        query = sa.select(
+            [
+                time.label("time"),
+                measurement_rollups.c.min.label("min"),
+                (measurement_rollups.c.sum / measurement_rollups.c.count).label("avg"),
+                measurement_rollups.c.max.label("max"),
+                measurement_rollups.c.count.label("count"),
+            ]
+        ).where(measurement_rollups.c.resolution == resolution)
+        query = query.where(measurement_rollups.c.sensor == sensor)
+        query = query.where(measurement_rollups.c.quantity == quantity)
+
+    query = query.where(time.between(start, end))
+    if after is not None:
+        query = query.where(time > after)
+    return query.order_by(time)
+
+
+class Bucketer:
+    """
+    Merges time ordered (time, min, avg, max, count) rows into buckets of
+    `width` seconds, yielding each bucket as soon as it is complete
+    """
+
+    def __init__(self, width):
+        self.width = width
+        self._bucket = None
+
+    def _flush(self):
+        index, min_, sum_, max_, count = self._bucket
+        self._bucket = None
+        return {"index": index, "min": min_, "avg": sum_ / count, "max": max_}
+
+    def add(self, time, min_, avg, max_, count):
+        """Returns the previous bucket if `time` starts a new one"""
+        timestamp = int(time.timestamp())
+        index = timestamp - timestamp % self.width
+        done = None
+        if self._bucket is not None and self._bucket[0] != index:
+            done = self._flush()
+        if self._bucket is None:
+            self._bucket = [index, min_, avg * count, max_, count]
+        else:
+            bucket = self._bucket
+            bucket[1] = min(bucket[1], min_)
+            bucket[2] += avg * count
+            bucket[3] = max(bucket[3], max_)
+            bucket[4] += count
+        return done
+
+    def finish(self):
+        return self._flush() if self._bucket is not None else None
@@ -0,0 +1,217 @@
+from bisect import bisect_left
+from time import perf_counter
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# Seconds, from a cached lookup up to a stalled database
+DEFAULT_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+)
+
+
+def _escape(value):
+    return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(perf_counter() - self.start)
+
+
+class _CounterValue:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self, name):
+        return [(name, (), self.value)]
+
+
+class _GaugeValue(_CounterValue):
+    __slots__ = ()
+
+    def set(self, value):
+        self.value = value
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self):
+        """Context manager observing the duration of its block"""
+        return _Timer(self)
+
+    def samples(self, name):
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            samples.append((f"{name}_bucket", (("le", _number(bound)),), cumulative))
+        samples.append((f"{name}_sum", (), self.sum))
+        samples.append((f"{name}_count", (), self.count))
+        return samples
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        if not self.labelnames:
+            self._default = self.labels()
+        registry.register(self)
+
+    def _new_value(self):
+        raise NotImplementedError()
+
+    def labels(self, *values):
+        """Child of the metric for one combination of label values"""
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}")
+        values = tuple(str(value) for value in values)
+        child = self._values.get(values)
+        if child is None:
+            child = self._values[values] = self._new_value()
+        return child
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        for values, child in sorted(self._values.items()):
+            for name, extra, value in child.samples(self.name):
+                labels = _labels(self.labelnames, values, extra)
+                lines.append(f"{name}{labels} {_number(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    type = "counter"
+
+    def _new_value(self):
+        return _CounterValue()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def set_total(self, value):
+        """Mirror a count kept elsewhere, such as the write-behind statistics"""
+        self._default.value = value
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, usually updated at scrape time"""
+
+    type = "gauge"
+
+    def _new_value(self):
+        return _GaugeValue()
+
+    def set(self, value):
+        self._default.set(value)
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def dec(self, amount=1):
+        self._default.dec(amount)
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values in fixed buckets, observing is one
+    bisection and three additions
+    """
+
+    type = "histogram"
+
+    def __init__(
+        self, registry, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(registry, name, documentation, labelnames)
+
+    def _new_value(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+
+class Registry:
+    """Metrics exposed together in the Prometheus text format"""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Duplicate metric {metric.name}")
+        self.metrics[metric.name] = metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,128 @@
+import asyncio
+import json
+import logging
+import uuid
+
+import sqlalchemy as sa
+
+from thermnet.storage import Reading, parse_time
+
+CHANNEL = "thermnet_measurements"
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+MAX_PAYLOAD = 7900
+
+_HUB = set()
+
+
+def encode(origin, readings):
+    """JSON payloads of at most `MAX_PAYLOAD` bytes carrying `readings`"""
+    prefix = f'{{"origin": {json.dumps(origin)}, "readings": ['
+    payloads = []
+    chunk = []
+    size = len(prefix) + 2
+    for reading in readings:
+        item = json.dumps(
+            [
+                reading.sensor,
+                reading.time.timestamp(),
+                sorted(reading.values.items()),
+            ]
+        )
+        if chunk and size + len(item) + 2 > MAX_PAYLOAD:
+            payloads.append(prefix + ", ".join(chunk) + "]}")
+            chunk = []
+            size = len(prefix) + 2
+        chunk.append(item)
+        size += len(item) + 2
+    if chunk:
+        payloads.append(prefix + ", ".join(chunk) + "]}")
+    return payloads
+
+
+def decode(payload):
+    """Origin and readings of a payload made by `encode()`"""
+    data = json.loads(payload)
+    return data["origin"], [
+        Reading(parse_time(timestamp), sensor, dict(values))
+        for sensor, timestamp, values in data["readings"]
+    ]
+
+
+class LocalBus:
+    """
+    Notification bus between the apps of one process, for a single worker
+    and for tests. Buses sharing a `hub`, by default all of them, see each
+    other.
+    """
+
+    def __init__(self, hub=None):
+        self.origin = uuid.uuid4().hex
+        self.hub = hub if hub is not None else _HUB
+        self._callback = None
+
+    def statements(self, readings):
+        return []
+
+    async def committed(self, readings):
+        await self.publish(readings)
+
+    async def publish(self, readings):
+        for bus in self.hub:
+            if bus is not self and bus._callback is not None:
+                bus._callback(readings)
+
+    async def listen(self, callback):
+        self._callback = callback
+        self.hub.add(self)
+        try:
+            await asyncio.Future()
+        finally:
+            self.hub.discard(self)
+
+
+class PostgresBus:
+    """
+    Readings stored by any worker, delivered to all others with Postgres
+    LISTEN/NOTIFY. Notifications sent in the transaction storing the
+    readings go out on commit only.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.origin = uuid.uuid4().hex
+
+    def statements(self, readings):
+        """
+        Statements notifying `readings`, to run in the transaction storing
+        them, followed by `committed()` once it commits
+        """
+        return [
+            sa.select([sa.func.pg_notify(CHANNEL, payload)])
+            for payload in encode(self.origin, readings)
+        ]
+
+    async def committed(self, readings):
+        pass
+
+    async def listen(self, callback):
+        """Call `callback` with the readings notified by other workers"""
+        while True:
+            try:
+                async with self.engine.acquire() as conn:
+                    await conn.execute(f"LISTEN {CHANNEL}")
+                    while True:
+                        notify = await conn.connection.notifies.get()
+                        try:
+                            origin, readings = decode(notify.payload)
+                        except (KeyError, TypeError, ValueError) as e:
+                            logging.warning(f"Invalid {CHANNEL} notification: {e}")
+                            continue
+                        if origin != self.origin:
+                            callback(readings)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Readings stored by other workers meanwhile never make it
+                # into this worker's dashboard
+                logging.warning(f"Lost {CHANNEL} listener: {e}, retrying")
+                await asyncio.sleep(5)
@@ -0,0 +1,241 @@
+import argparse
+import configparser
+import logging
+import re
+from datetime import datetime, timedelta, timezone
+
+import sqlalchemy as sa
+from sqlalchemy.sql import text
+
+from thermnet.logging import setup_logging
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--config", default="/etc/thermnet/thermnet.ini")
+parser.add_argument("--dry-run", action="store_true")
+
+config = configparser.ConfigParser()
+config.read_dict(
+    {
+        "db": {"url": "postgresql://thermnet@localhost/thermnet"},
+        "partitions": {
+            "interval": "month",
+            "ahead": "3",
+            "retention_days": "0",
+            "expired": "drop",
+        },
+        "logging": {"level": "INFO"},
+    }
+)
+
+TABLE = "readings"
+INTERVALS = ("month", "week", "day")
+# Serializes concurrent maintenance runs
+LOCK_ID = 0x7468726D
+
+_BOUND = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+def period_start(time, interval):
+    """Start of the partition period containing `time`, in UTC"""
+    time = time.astimezone(timezone.utc).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    if interval == "month":
+        return time.replace(day=1)
+    if interval == "week":
+        return time - timedelta(days=time.weekday())
+    if interval == "day":
+        return time
+    raise ValueError(f"Unknown partition interval: {interval}")
+
+
+def next_period(time, interval):
+    """Start of the period following the one containing `time`"""
+    start = period_start(time, interval)
+    if interval == "month":
+        return (start + timedelta(days=32)).replace(day=1)
+    if interval == "week":
+        return start + timedelta(days=7)
+    return start + timedelta(days=1)
+
+
+def parse_bound(value):
+    # Postgres abbreviates whole hour offsets to +HH
+    time = datetime.fromisoformat(re.sub(r"([+-]\d\d)$", r"\1:00", value))
+    if time.tzinfo is None:
+        time = time.replace(tzinfo=timezone.utc)
+    return time
+
+
+def partitions(conn):
+    """(name, start, end) of the range partitions of the table, oldest first"""
+    rows = conn.execute(
+        text(
+            """
+            SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+            FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = CAST(:table AS regclass)
+            """
+        ),
+        table=TABLE,
+    )
+    ranges = []
+    for name, bound in rows:
+        m = _BOUND.search(bound)
+        if m:
+            ranges.append((name, parse_bound(m.group(1)), parse_bound(m.group(2))))
+    return sorted(ranges, key=lambda partition: partition[1])
+
+
+def default_partition(conn):
+    """Name of the default partition of the table, None without one"""
+    return conn.execute(
+        text(
+            """
+            SELECT c.relname
+            FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = CAST(:table AS regclass)
+            AND pg_get_expr(c.relpartbound, c.oid) = 'DEFAULT'
+            """
+        ),
+        table=TABLE,
+    ).scalar()
+
+
+def stranded(conn, default, start, stop):
+    """Whether the default partition holds rows of the range [start, stop)"""
+    return conn.execute(
+        text(
+            f"""
+            SELECT EXISTS (
+                SELECT 1 FROM "{default}" WHERE time >= :start AND time < :stop
+            )
+            """
+        ),
+        start=start,
+        stop=stop,
+    ).scalar()
+
+
+def plan(existing, now, interval, ahead, retention):
+    """
+    Ranges to create so that partitions reach `ahead` periods past the
+    current one, and names of partitions entirely older than `retention`
+    """
+    end = period_start(now, interval)
+    for _ in range(ahead + 1):
+        end = next_period(end, interval)
+
+    create = []
+    start = existing[-1][2] if existing else period_start(now, interval)
+    while start < end:
+        stop = next_period(start, interval)
+        create.append((f"{TABLE}_{start:%Y%m%d}", start, stop))
+        start = stop
+
+    expired = []
+    if retention:
+        expired = [name for name, _, stop in existing if stop <= now - retention]
+    return create, expired
+
+
+def maintain(conn, now, interval, ahead, retention, expired_action, dry_run=False):
+    conn.execute(text("SET LOCAL TIME ZONE 'UTC'"))
+    conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), id=LOCK_ID)
+    create, expired = plan(partitions(conn), now, interval, ahead, retention)
+
+    # Postgres refuses a range overlapping rows of the default partition,
+    # e.g. from devices with a wrong clock or after maintenance lapsed. The
+    # default is detached while such ranges are created and their rows moved.
+    default = default_partition(conn)
+    moves = []
+    if default is not None:
+        moves = [
+            (name, start, stop)
+            for name, start, stop in create
+            if stranded(conn, default, start, stop)
+        ]
+    if moves:
+        logging.info(f"Detaching default partition {default}")
+        if not dry_run:
+            conn.execute(text(f'ALTER TABLE {TABLE} DETACH PARTITION "{default}"'))
+
+    for name, start, stop in create:
+        logging.info(f"Creating partition {name} for [{start}, {stop})")
+        if not dry_run:
+            conn.execute(
+                text(
+                    f'CREATE TABLE "{name}" PARTITION OF {TABLE} '
+                    f"FOR VALUES FROM ('{start.isoformat()}') TO ('{stop.isoformat()}')"
+                )
+            )
+
+    for name, start, stop in moves:
+        logging.info(f"Moving rows of [{start}, {stop}) out of {default}")
+        if not dry_run:
+            conn.execute(
+                text(
+                    f"""
+                    WITH moved AS (
+                        DELETE FROM "{default}"
+                        WHERE time >= :start AND time < :stop
+                        RETURNING *
+                    )
+                    INSERT INTO "{name}" SELECT * FROM moved
+                    """
+                ),
+                start=start,
+                stop=stop,
+            )
+    if moves:
+        logging.info(f"Attaching default partition {default}")
+        if not dry_run:
+            conn.execute(
+                text(f'ALTER TABLE {TABLE} ATTACH PARTITION "{default}" DEFAULT')
+            )
+
+    for name in expired:
+        if expired_action == "detach":
+            # Left in place as a plain table for archiving
+            logging.info(f"Detaching expired partition {name}")
+            statement = f'ALTER TABLE {TABLE} DETACH PARTITION "{name}"'
+        else:
+            logging.info(f"Dropping expired partition {name}")
+            statement = f'DROP TABLE "{name}"'
+        if not dry_run:
+            conn.execute(text(statement))
+
+    return create, expired
+
+
+def main(args=None):
+    args = parser.parse_args(args)
+    config.read(args.config)
+
+    setup_logging(config["logging"]["level"])
+
+    section = config["partitions"]
+    interval = section["interval"]
+    if interval not in INTERVALS:
+        raise ValueError(f"Unknown partition interval: {interval}")
+    expired_action = section["expired"]
+    if expired_action not in ("drop", "detach"):
+        raise ValueError(f"Unknown action for expired partitions: {expired_action}")
+    retention_days = section.getint("retention_days")
+
+    engine = sa.create_engine(config["db"]["url"])
+    with engine.connect() as conn:
+        with conn.begin():
+            maintain(
+                conn,
+                datetime.now(timezone.utc),
+                interval,
+                section.getint("ahead"),
+                timedelta(days=retention_days) if retention_days else None,
+                expired_action,
+                args.dry_run,
+            )
+
+
+if __name__ == "__main__":
+    main()
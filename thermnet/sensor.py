@@ -1,38 +1,138 @@
 import argparse
 import configparser
+import json
 import logging
+import math
+import os
 import re
-from datetime import datetime
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from time import monotonic, sleep
 
-import smbus
 import sqlalchemy as sa
 
 import thermnet.bme280
 from thermnet.logging import setup_logging
+from thermnet.simulation import SimulatedBME280, SimulatedBus
+from thermnet.spool import Spool, Uploader
+from thermnet.storage import QUANTITIES, Reading, write_readings
+
+# Longest pause between reads of a failing capture, in seconds
+CAPTURE_MAX_BACKOFF = 60
 
 parser = argparse.ArgumentParser()
 parser.add_argument("--config", default="/etc/thermnet/thermnet.ini")
 parser.add_argument("--check", action="store_true")
+parser.add_argument("--daemon", action="store_true")
 
 config = configparser.ConfigParser()
 config.read_dict(
     {
         "db": {"url": "postgresql://thermnet@localhost/thermnet"},
+        "sampling": {"interval": "60", "calibration_cache": "", "bus_driver": "smbus"},
+        "simulation": {
+            "temperature": "21.0",
+            "pressure": "1013.25",
+            "humidity": "45.0",
+            "noise": "0.0",
+            "time_scale": "1.0",
+            "byte_time": "0.0",
+        },
+        "spool": {
+            "path": "",
+            "max_bytes": "16777216",
+            "batch_size": "1000",
+            "retry_interval": "30",
+        },
         "logging": {"level": "INFO"},
     }
 )
 
 
-def main(args=None):
-    args = parser.parse_args(args)
-    config.read(args.config)
+STANDBY_PERIODS = {
+    0.5: thermnet.bme280.STANDBY_TC_0_5,
+    10: thermnet.bme280.STANDBY_TC_10,
+    20: thermnet.bme280.STANDBY_TC_20,
+    62.5: thermnet.bme280.STANDBY_TC_62_5,
+    125: thermnet.bme280.STANDBY_TC_125,
+    250: thermnet.bme280.STANDBY_TC_250,
+    500: thermnet.bme280.STANDBY_TC_500,
+    1000: thermnet.bme280.STANDBY_TC_1000,
+}
+IIR_FILTERS = {
+    0: thermnet.bme280.IIR_FILTER_DISABLE,
+    2: thermnet.bme280.IIR_FILTER_X2,
+    4: thermnet.bme280.IIR_FILTER_X4,
+    8: thermnet.bme280.IIR_FILTER_X8,
+    16: thermnet.bme280.IIR_FILTER_X16,
+}
 
-    setup_logging(config["logging"]["level"])
 
-    if args.check and logging.getLogger().getEffectiveLevel() > logging.INFO:
-        logging.warning("--check was specified, overriding log level to INFO")
-        logging.getLogger().setLevel(logging.INFO)
+def open_bus(bus):
+    """
+    Handle of I2C bus number `bus`, either the real one or, with
+    `bus_driver = simulated`, one with a simulated BME280 at every address
+    """
+    driver = config["sampling"]["bus_driver"]
+    if driver == "smbus":
+        import smbus  # pylint: disable=import-outside-toplevel
+
+        return smbus.SMBus(bus)
+    if driver == "simulated":
+        simulation = config["simulation"]
+        return SimulatedBus(
+            factory=lambda address: SimulatedBME280(
+                simulation.getfloat("temperature"),
+                simulation.getfloat("pressure"),
+                simulation.getfloat("humidity"),
+                simulation.getfloat("noise"),
+                simulation.getfloat("time_scale"),
+                seed=f"{bus}:{address}",
+            ),
+            byte_time=simulation.getfloat("byte_time"),
+        )
+    raise ValueError(f"Unknown bus driver: {driver}")
 
+
+def load_calibrations(path):
+    """Cached calibrations keyed by "bus:address", empty if unavailable"""
+    if not path:
+        return {}
+    try:
+        with open(path) as f:
+            calibrations = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring calibration cache {path}: {e}")
+        return {}
+    return calibrations if isinstance(calibrations, dict) else {}
+
+
+def save_calibrations(path, calibrations):
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(calibrations, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logging.warning(f"Failed to save calibration cache {path}: {e}")
+
+
+def open_sensors(capture=False):
+    """
+    Open every configured sensor, sharing one handle per bus. Returns the
+    sensors sampled with forced conversions and, if `capture` is set,
+    captures of the sensors configured with `mode = normal`.
+    """
+    cache_path = config["sampling"]["calibration_cache"]
+    calibrations = load_calibrations(cache_path)
+    cached = dict(calibrations)
+    buses = {}
+    sensors = []
+    captures = []
     for section, kv in config.items():
         m = re.match("sensor-(.+)", section)
         if not m:
@@ -61,43 +161,303 @@ def main(args=None):
             logging.error(f"Invalid sensor address: {kv['address']}, skipping")
             continue
 
-        logging.info(f"Found sensor {sensor_id} config: {hex(address)} @ bus {bus}")
-
+        mode = kv.get("mode", "forced")
+        if mode not in ("forced", "normal"):
+            logging.error(f"Invalid sensor mode: {mode}, skipping")
+            continue
         try:
-            i2c = smbus.SMBus(bus)
-        except FileNotFoundError:
-            logging.error(f"Bus {bus} not found, skipping")
+            standby = STANDBY_PERIODS[float(kv.get("standby", "125"))]
+            iir_filter = IIR_FILTERS[int(kv.get("iir_filter", "0"))]
+        except (KeyError, ValueError) as e:
+            logging.error(f"Invalid capture setting {e} in section {section}, skipping")
             continue
 
+        logging.info(f"Found sensor {sensor_id} config: {hex(address)} @ bus {bus}")
+
+        if bus not in buses:
+            try:
+                buses[bus] = open_bus(bus)
+            except FileNotFoundError:
+                logging.error(f"Bus {bus} not found, skipping")
+                continue
+
+        key = f"{bus}:{hex(address)}"
         try:
-            bme = thermnet.bme280.Adafruit_BME280_I2C(i2c, address)
+            bme = thermnet.bme280.Adafruit_BME280_I2C(
+                buses[bus], address, calibrations.get(key)
+            )
         except OSError as e:
             logging.error(f"{e}, please check sensor address: {address}, skipping")
             continue
+        calibrations[key] = bme.calibration
 
-        t, p, h = (bme.temperature, bme.pressure, bme.humidity)
-        logging.info(f"Got data from sensor: {t:.2f} °C, {p:.2f} hPa, {h:.2f}%")
-
-        if args.check:
+        if mode == "normal" and capture:
+            try:
+                bme.iir_filter = iir_filter
+                bme.standby_period = standby
+                bme.mode = thermnet.bme280.MODE_NORMAL
+            except OSError as e:
+                logging.error(f"Failed to configure sensor {sensor_id}: {e}, skipping")
+                continue
+            captures.append(Capture(sensor_id, bme, standby_ms(standby)))
             continue
 
-        with sa.create_engine(config["db"]["url"]).connect() as conn:
-            conn.execute(
-                sa.text(
-                    """
-                    INSERT INTO measurements (time, value, sensor, quantity) VALUES
-                    (:time, :temperature, :sensor, 1),
-                    (:time, :pressure, :sensor, 2),
-                    (:time, :humidity, :sensor, 3)
-                """
-                ),
-                time=datetime.utcnow(),
-                sensor=sensor_id,
-                temperature=t,
-                pressure=p,
-                humidity=h,
+        sensors.append((sensor_id, bus, bme))
+
+    if cache_path and calibrations != cached:
+        save_calibrations(cache_path, calibrations)
+    return sensors, captures
+
+
+def standby_ms(standby):
+    return next(ms for ms, value in STANDBY_PERIODS.items() if value == standby)
+
+
+class Capture(threading.Thread):
+    """
+    Reads a sensor running in normal mode once per conversion cycle, without
+    polling its status, and keeps min/mean/max of the samples until `take()`
+    """
+
+    def __init__(self, sensor_id, bme, standby):
+        super().__init__(daemon=True)
+        self.sensor_id = sensor_id
+        self.bme = bme
+        # Never faster than the chip, so that no conversion is read twice
+        self.period = (standby + bme.measurement_time_max) / 1000
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._count = 0
+        self._min = [math.inf] * 3
+        self._max = [-math.inf] * 3
+        self._sum = [0.0] * 3
+
+    def run(self):
+        try:
+            self._capture()
+        except Exception:
+            logging.exception(f"Capture of sensor {self.sensor_id} stopped")
+
+    def _capture(self):
+        start = monotonic()
+        ticks = 0
+        failures = 0
+        while True:
+            try:
+                values = self.bme.read_all(measure=False)
+            except OSError as e:
+                failures += 1
+                # A disconnected sensor fails every cycle, log 1st, 2nd, 4th...
+                if failures & (failures - 1) == 0:
+                    logging.error(
+                        f"Failed to read sensor {self.sensor_id} "
+                        f"({failures} in a row): {e}"
+                    )
+                sleep(min(self.period * 2 ** failures, CAPTURE_MAX_BACKOFF))
+                continue
+
+            if failures:
+                logging.info(
+                    f"Sensor {self.sensor_id} recovered after {failures} failures"
+                )
+                failures = 0
+            with self._lock:
+                self._count += 1
+                for i, value in enumerate(values):
+                    self._min[i] = min(self._min[i], value)
+                    self._max[i] = max(self._max[i], value)
+                    self._sum[i] += value
+
+            ticks = max(ticks + 1, int((monotonic() - start) / self.period) + 1)
+            sleep(max(0.0, start + ticks * self.period - monotonic()))
+
+    def take(self, time):
+        """Aggregate of the samples since the last call, None if there are none"""
+        with self._lock:
+            count = self._count
+            stats = list(zip(self._min, self._max, self._sum))
+            self._reset()
+        if not count:
+            return None
+
+        quantities = (
+            QUANTITIES["temperature"],
+            QUANTITIES["pressure"],
+            QUANTITIES["humidity"],
+        )
+        t, p, h = (sum_ / count for _, _, sum_ in stats)
+        logging.info(
+            f"Got {count} samples from sensor {self.sensor_id}: "
+            f"{t:.2f} °C, {p:.2f} hPa, {h:.2f}%"
+        )
+        return Reading(
+            time,
+            self.sensor_id,
+            dict(zip(quantities, (t, p, h))),
+            {
+                quantity: (min_, max_, sum_, count)
+                for quantity, (min_, max_, sum_) in zip(quantities, stats)
+            },
+        )
+
+
+class Poller:
+    """
+    Samples all sensors at once: conversions are started on every device,
+    awaited once for the slowest of them and then read out. Each bus is
+    served by its own worker thread, devices on one bus go in sequence.
+    """
+
+    def __init__(self, sensors, captures=()):
+        self.captures = captures
+        self.buses = defaultdict(list)
+        for sensor_id, bus, bme in sensors:
+            self.buses[bus].append((sensor_id, bme))
+        self.executor = ThreadPoolExecutor(max_workers=max(1, len(self.buses)))
+        self.conversion_time = max(
+            (bme.measurement_time_max for _, _, bme in sensors), default=0
+        )
+
+    def _start(self, devices):
+        started = []
+        for sensor_id, bme in devices:
+            try:
+                bme.start_measurement()
+            except OSError as e:
+                logging.error(f"Failed to start sensor {sensor_id}: {e}, skipping")
+                continue
+            started.append((sensor_id, bme))
+        return started
+
+    def _read(self, devices, time):
+        readings = []
+        for sensor_id, bme in devices:
+            try:
+                t, p, h = bme.read_all(measure=False)
+            except OSError as e:
+                logging.error(f"Failed to read sensor {sensor_id}: {e}, skipping")
+                continue
+            logging.info(f"Got data from sensor: {t:.2f} °C, {p:.2f} hPa, {h:.2f}%")
+
+            readings.append(
+                Reading(
+                    time,
+                    sensor_id,
+                    {
+                        QUANTITIES["temperature"]: t,
+                        QUANTITIES["pressure"]: p,
+                        QUANTITIES["humidity"]: h,
+                    },
+                )
             )
-            logging.info("Committed to database")
+        return readings
+
+    def sample(self):
+        time = datetime.utcnow().replace(tzinfo=timezone.utc)
+        started = list(self.executor.map(self._start, self.buses.values()))
+        sleep(self.conversion_time / 1000)
+        readings = [
+            reading
+            for readings in self.executor.map(
+                lambda devices: self._read(devices, time), started
+            )
+            for reading in readings
+        ]
+        for capture in self.captures:
+            reading = capture.take(time)
+            if reading is not None:
+                readings.append(reading)
+        return readings
+
+
+def store(engine, readings):
+    with engine.connect() as conn:
+        with conn.begin():
+            for stmt in write_readings(readings):
+                conn.execute(stmt)
+    logging.info(f"Committed {len(readings)} readings to database")
+
+
+def open_spool(engine):
+    if not config["spool"]["path"]:
+        return None, None
+    spool = Spool(config["spool"]["path"], config["spool"].getint("max_bytes"))
+    uploader = Uploader(
+        spool,
+        lambda readings: store(engine, readings),
+        config["spool"].getint("batch_size"),
+        config["spool"].getfloat("retry_interval"),
+    )
+    if len(spool):
+        logging.info(f"Found {len(spool)} spooled readings")
+    return spool, uploader
+
+
+def run(poller, engine, interval):
+    """
+    Sample every `interval` seconds on a fixed schedule, a slow cycle skips
+    the ticks it overran instead of shifting all later ones
+    """
+    spool, uploader = open_spool(engine)
+    if uploader is not None:
+        uploader.start()
+        uploader.wakeup.set()
+
+    start = monotonic()
+    ticks = 0
+    while True:
+        readings = poller.sample()
+        if readings and spool is not None:
+            spool.append(readings)
+            uploader.wakeup.set()
+        elif readings:
+            try:
+                store(engine, readings)
+            except sa.exc.SQLAlchemyError as e:
+                logging.error(f"Failed to store {len(readings)} readings: {e}")
+
+        ticks = max(ticks + 1, int((monotonic() - start) / interval) + 1)
+        sleep(max(0.0, start + ticks * interval - monotonic()))
+
+
+def main(args=None):
+    args = parser.parse_args(args)
+    config.read(args.config)
+
+    setup_logging(config["logging"]["level"])
+
+    if args.check and logging.getLogger().getEffectiveLevel() > logging.INFO:
+        logging.warning("--check was specified, overriding log level to INFO")
+        logging.getLogger().setLevel(logging.INFO)
+
+    sensors, captures = open_sensors(capture=args.daemon)
+    for capture in captures:
+        capture.start()
+    poller = Poller(sensors, captures)
+
+    if args.check:
+        poller.sample()
+        return
+
+    engine = sa.create_engine(config["db"]["url"])
+    if args.daemon:
+        run(poller, engine, config["sampling"].getfloat("interval"))
+        return
+
+    readings = poller.sample()
+    spool, uploader = open_spool(engine)
+    if spool is None:
+        if readings:
+            store(engine, readings)
+        return
+
+    # Readings survive in the spool until a later run manages to upload them
+    if readings:
+        spool.append(readings)
+    uploader.drain()
+    spool.close()
 
 
 if __name__ == "__main__":
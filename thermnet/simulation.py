@@ -0,0 +1,244 @@
+import errno
+import random
+import struct
+import threading
+from time import monotonic, sleep
+
+import thermnet.bme280 as bme280
+
+# Calibration of the typical part from the datasheet's compensation example
+CALIBRATION = {
+    "temperature": (27504, 26435, -1000),
+    "pressure": (36477, -10685, 3024, 2855, 140, -7, 15500, -14600, 6000),
+    "humidity": (75, 362, 0, 313, 50, 30),
+}
+
+_STANDBY_MS = {
+    bme280.STANDBY_TC_0_5: 0.5,
+    bme280.STANDBY_TC_10: 10,
+    bme280.STANDBY_TC_20: 20,
+    bme280.STANDBY_TC_62_5: 62.5,
+    bme280.STANDBY_TC_125: 125,
+    bme280.STANDBY_TC_250: 250,
+    bme280.STANDBY_TC_500: 500,
+    bme280.STANDBY_TC_1000: 1000,
+}
+
+# Data registers after a reset or with the measurement skipped
+_SKIPPED = (0x80000, 0x80000, 0x8000)
+
+
+def _register_map(calibration):
+    registers = bytearray(256)
+    registers[0xD0] = 0x60
+    registers[0x88:0xA0] = struct.pack(
+        "<Hhh", *calibration["temperature"]
+    ) + struct.pack("<Hhhhhhhhh", *calibration["pressure"])
+    h1, h2, h3, h4, h5, h6 = calibration["humidity"]
+    registers[0xA1] = h1
+    registers[0xE1:0xE8] = struct.pack(
+        "<hBbBbb", h2, h3, h4 >> 4, (h4 & 0xF) | (h5 & 0xF) << 4, h5 >> 4, h6
+    )
+    return registers
+
+
+class _Compensation(bme280.Adafruit_BME280):
+    """The driver's compensation formulas, without a device behind them"""
+
+    def __init__(self, calibration):  # pylint: disable=super-init-not-called
+        self._temp_calib = [float(x) for x in calibration["temperature"]]
+        self._pressure_calib = [float(x) for x in calibration["pressure"]]
+        self._humidity_calib = [float(x) for x in calibration["humidity"]]
+        self._t_fine = None
+
+
+def _oversampling(setting):
+    return min(1 << (setting - 1), 16)
+
+
+def _invert(f, target, bits, increasing=True):
+    """Raw value in [0, 2 ** bits) for which monotonic `f` is nearest `target`"""
+    lo, hi = 0, (1 << bits) - 1
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if (f(mid) < target) == increasing:
+            lo = mid + 1
+        else:
+            hi = mid
+    if lo and abs(f(lo - 1) - target) < abs(f(lo) - target):
+        return lo - 1
+    return lo
+
+
+class SimulatedBME280:
+    """
+    Register-level model of a BME280: soft reset, forced and normal mode and
+    the measuring status bit. Conversions take the typical time of the
+    configured oversampling, scaled by `time_scale`, and produce the raw
+    values the driver compensates back to the given `temperature`, `pressure`
+    and `humidity` plus gaussian `noise` of that standard deviation. The IIR
+    filter is not modelled.
+    """
+
+    def __init__(
+        self,
+        temperature=21.0,
+        pressure=1013.25,
+        humidity=45.0,
+        noise=0.0,
+        time_scale=1.0,
+        calibration=CALIBRATION,
+        seed=None,
+    ):
+        self.temperature = temperature
+        self.pressure = pressure
+        self.humidity = humidity
+        self.noise = noise
+        self.time_scale = time_scale
+        self.conversions = 0
+        self._compensation = _Compensation(calibration)
+        self._calibration = _register_map(calibration)
+        self._random = random.Random(seed)
+        self._reset()
+
+    def _reset(self):
+        self.registers = bytearray(self._calibration)
+        self._set_data(*_SKIPPED)
+        self._started = None
+
+    def _set_data(self, raw_temperature, raw_pressure, raw_humidity):
+        self.registers[0xF7:0xFA] = (raw_pressure << 4).to_bytes(3, "big")
+        self.registers[0xFA:0xFD] = (raw_temperature << 4).to_bytes(3, "big")
+        self.registers[0xFD:0xFF] = raw_humidity.to_bytes(2, "big")
+
+    @property
+    def _mode(self):
+        return self.registers[0xF4] & 0x3
+
+    def _measurement_time(self):
+        """Typical conversion time in seconds for the current settings"""
+        temperature = self.registers[0xF4] >> 5
+        pressure = self.registers[0xF4] >> 2 & 0x7
+        humidity = self.registers[0xF2] & 0x7
+        ms = 1.0
+        if temperature:
+            ms += 2 * _oversampling(temperature)
+        if pressure:
+            ms += 2 * _oversampling(pressure) + 0.5
+        if humidity:
+            ms += 2 * _oversampling(humidity) + 0.5
+        return ms / 1000 * self.time_scale
+
+    def _standby_time(self):
+        return _STANDBY_MS[self.registers[0xF5] >> 5] / 1000 * self.time_scale
+
+    def _convert(self):
+        c = self._compensation
+        noise = self.noise
+        temperature = self.temperature + self._random.gauss(0, noise)
+        pressure = self.pressure + self._random.gauss(0, noise)
+        humidity = self.humidity + self._random.gauss(0, noise)
+
+        def compensate_temperature(raw):
+            c._compensate_temperature(raw)
+            return c._t_fine / 5120.0
+
+        raw_temperature = _invert(compensate_temperature, temperature, 20)
+        compensate_temperature(raw_temperature)
+        raw_pressure = _invert(c._compensate_pressure, pressure, 20, False)
+        raw_humidity = _invert(c._compensate_humidity, humidity, 16)
+        self._set_data(raw_temperature, raw_pressure, raw_humidity)
+        self.conversions += 1
+
+    def _update(self):
+        """Complete the conversions due by now"""
+        if self._started is None:
+            return False
+        now = monotonic()
+        measurement = self._measurement_time()
+        if self._mode == bme280.MODE_NORMAL:
+            period = measurement + self._standby_time()
+            elapsed = now - self._started
+            cycles = int(elapsed / period) if period else 0
+            done = cycles + (elapsed - cycles * period >= measurement)
+            if done > self._cycles:
+                self._convert()
+                self._cycles = done
+            return elapsed - cycles * period < measurement
+        if now - self._started < measurement:
+            return True
+        # A forced conversion ends by going back to sleep
+        self._convert()
+        self.registers[0xF4] &= ~0x3
+        self._started = None
+        return False
+
+    def read(self, register, length):
+        measuring = self._update()
+        data = bytearray(self.registers[register : register + length])
+        if register <= 0xF3 < register + length:
+            data[0xF3 - register] = 0x08 if measuring else 0
+        return data
+
+    def write(self, register, value):
+        self._update()
+        if register == 0xE0:
+            if value == 0xB6:
+                self._reset()
+            return
+        if register not in (0xF2, 0xF4, 0xF5):
+            return
+        self.registers[register] = value
+        if register == 0xF4:
+            mode = value & 0x3
+            if mode == bme280.MODE_SLEEP:
+                self._started = None
+            elif mode != bme280.MODE_NORMAL or self._started is None:
+                self._started = monotonic()
+                self._cycles = 0
+
+
+class SimulatedBus:
+    """
+    In-memory stand-in for `smbus.SMBus` with simulated devices keyed by
+    address. Unknown addresses get a device from `factory` if one is given,
+    or fail like a missing chip. Each transaction holds the bus and takes
+    `byte_time` seconds per byte on it.
+    """
+
+    def __init__(self, devices=None, factory=None, byte_time=0.0):
+        self.devices = dict(devices or {})
+        self.factory = factory
+        self.byte_time = byte_time
+        self.transactions = 0
+        self._lock = threading.Lock()
+
+    def _device(self, address):
+        if address not in self.devices:
+            if self.factory is None:
+                raise OSError(errno.EREMOTEIO, "Remote I/O error")
+            self.devices[address] = self.factory(address)
+        return self.devices[address]
+
+    def _transfer(self, size):
+        self.transactions += 1
+        if self.byte_time:
+            sleep(size * self.byte_time)
+
+    def read_i2c_block_data(self, address, register, length):
+        with self._lock:
+            device = self._device(address)
+            self._transfer(2 + length)
+            return list(device.read(register, length))
+
+    def read_byte_data(self, address, register):
+        return self.read_i2c_block_data(address, register, 1)[0]
+
+    def write_byte_data(self, address, register, value):
+        with self._lock:
+            device = self._device(address)
+            self._transfer(3)
+            device.write(register, value)
+
+    def close(self):
+        pass
@@ -0,0 +1,250 @@
+import logging
+import os
+import struct
+import threading
+import zlib
+from datetime import datetime, timezone
+
+from thermnet.storage import QUANTITIES, Reading
+
+# time, sensor, sample count, then mean, min and max of temperature, pressure
+# and humidity, followed by a CRC32 of those
+_PAYLOAD = struct.Struct("<diI9d")
+_CRC = struct.Struct("<I")
+RECORD_SIZE = _PAYLOAD.size + _CRC.size
+
+_QUANTITIES = (
+    QUANTITIES["temperature"],
+    QUANTITIES["pressure"],
+    QUANTITIES["humidity"],
+)
+
+
+def _pack(reading):
+    if reading.stats is not None:
+        count = reading.stats[_QUANTITIES[0]][3]
+        mins = [reading.stats[quantity][0] for quantity in _QUANTITIES]
+        maxs = [reading.stats[quantity][1] for quantity in _QUANTITIES]
+    else:
+        count = 1
+        mins = maxs = [reading.values[quantity] for quantity in _QUANTITIES]
+    payload = _PAYLOAD.pack(
+        reading.time.timestamp(),
+        reading.sensor,
+        count,
+        *(reading.values[quantity] for quantity in _QUANTITIES),
+        *mins,
+        *maxs,
+    )
+    return payload + _CRC.pack(zlib.crc32(payload))
+
+
+def _unpack(record):
+    payload = record[: _PAYLOAD.size]
+    (crc,) = _CRC.unpack_from(record, _PAYLOAD.size)
+    if zlib.crc32(payload) != crc:
+        raise ValueError("Spool record checksum mismatch")
+    timestamp, sensor, count, *values = _PAYLOAD.unpack(payload)
+    means, mins, maxs = values[0:3], values[3:6], values[6:9]
+    stats = None
+    if count != 1:
+        stats = {
+            quantity: (min_, max_, mean * count, count)
+            for quantity, mean, min_, max_ in zip(_QUANTITIES, means, mins, maxs)
+        }
+    return Reading(
+        datetime.fromtimestamp(timestamp, timezone.utc),
+        sensor,
+        dict(zip(_QUANTITIES, means)),
+        stats,
+    )
+
+
+class Spool:
+    """
+    Append-only file of fixed size readings records in `directory`, with the
+    generation of that file and the offset of the first record not yet
+    uploaded kept next to it. Records are fsynced before `append()` returns
+    and the generation and offset are replaced together atomically, also
+    when compaction switches to a new file, so after a crash at worst the
+    last batch is uploaded twice.
+    """
+
+    def __init__(self, directory, max_bytes):
+        os.makedirs(directory, exist_ok=True)
+        self.max_bytes = max_bytes - max_bytes % RECORD_SIZE
+        self._directory = directory
+        self._offset_path = os.path.join(directory, "offset")
+        self._lock = threading.Lock()
+
+        self._generation, self._offset = self._read_offset()
+        self._remove_stale()
+        self._file = open(self._data_path(self._generation), "a+b")
+        # Logical position of the start of the file, offsets handed out by
+        # `read()` stay valid across compactions and resets
+        self._base = 0
+        self._recover()
+
+    def _data_path(self, generation):
+        return os.path.join(self._directory, f"readings.{generation}.spool")
+
+    def _remove_stale(self):
+        """Delete files of other generations left by a crash in `_compact()`"""
+        current = os.path.basename(self._data_path(self._generation))
+        for name in os.listdir(self._directory):
+            if name.startswith("readings.") and name != current:
+                logging.warning(f"Removing stale spool file {name}")
+                os.remove(os.path.join(self._directory, name))
+
+    def _read_offset(self):
+        try:
+            with open(self._offset_path, "rb") as f:
+                data = f.read(16)
+        except FileNotFoundError:
+            return 0, 0
+        if len(data) != 16:
+            return 0, 0
+        return struct.unpack("<QQ", data)
+
+    def _write_offset(self, offset, generation=None):
+        if generation is None:
+            generation = self._generation
+        tmp_path = self._offset_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(struct.pack("<QQ", generation, offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._offset_path)
+        self._generation = generation
+        self._offset = offset
+
+    def _size(self):
+        return os.fstat(self._file.fileno()).st_size
+
+    def _recover(self):
+        """Drop a torn or corrupt tail left by a crash during `append()`"""
+        size = self._size()
+        size -= size % RECORD_SIZE
+        while size > self._offset:
+            self._file.seek(size - RECORD_SIZE)
+            try:
+                _unpack(self._file.read(RECORD_SIZE))
+                break
+            except ValueError:
+                size -= RECORD_SIZE
+        if size != self._size():
+            logging.warning(f"Truncating spool to {size} bytes after crash")
+            self._file.truncate(size)
+        if self._offset > size:
+            self._write_offset(size)
+
+    def __len__(self):
+        with self._lock:
+            return (self._size() - self._offset) // RECORD_SIZE
+
+    def append(self, readings):
+        data = b"".join(_pack(reading) for reading in readings)
+        with self._lock:
+            if self._size() + len(data) > self.max_bytes:
+                self._compact(len(data))
+            self._file.seek(0, os.SEEK_END)
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def _compact(self, incoming):
+        """Rewrite the spool without uploaded records, then oldest ones"""
+        keep = max(0, self.max_bytes - incoming)
+        start = max(self._offset, self._size() - keep)
+        if start > self._offset:
+            dropped = (start - self._offset) // RECORD_SIZE
+            logging.warning(f"Spool full, dropping {dropped} oldest readings")
+
+        self._file.seek(start)
+        pending = self._file.read()
+        generation = self._generation + 1
+        with open(self._data_path(generation), "wb") as f:
+            f.write(pending)
+            f.flush()
+            os.fsync(f.fileno())
+        # Switching to the new file and resetting the offset is the one
+        # atomic replace of the offset file, a crash before it leaves the old
+        # file and offset in place and the new file is removed on startup
+        old_path = self._data_path(self._generation)
+        self._write_offset(0, generation)
+        self._file.close()
+        os.remove(old_path)
+        self._file = open(self._data_path(generation), "a+b")
+        self._base += start
+
+    def read(self, max_records):
+        """
+        Oldest pending readings and the offset to `commit()` once they are
+        stored, None if there are none
+        """
+        with self._lock:
+            self._file.seek(self._offset)
+            data = self._file.read(max_records * RECORD_SIZE)
+            data = data[: len(data) - len(data) % RECORD_SIZE]
+            offset = self._base + self._offset + len(data)
+        if not data:
+            return [], None
+
+        readings = []
+        for position in range(0, len(data), RECORD_SIZE):
+            try:
+                readings.append(_unpack(data[position : position + RECORD_SIZE]))
+            except ValueError as e:
+                logging.error(f"Skipping spool record: {e}")
+        return readings, offset
+
+    def commit(self, offset):
+        with self._lock:
+            offset -= self._base
+            size = self._size()
+            if offset >= size:
+                # Everything is uploaded, start over with an empty file. A
+                # crash in between leaves an offset past the end, which
+                # `_recover()` handles
+                self._file.truncate(0)
+                self._write_offset(0)
+                self._base += size
+            elif offset > self._offset:
+                self._write_offset(offset)
+
+    def close(self):
+        self._file.close()
+
+
+class Uploader(threading.Thread):
+    """Drains `spool` to the database with `store` in batches"""
+
+    def __init__(self, spool, store, batch_size, retry_interval):
+        super().__init__(daemon=True)
+        self.spool = spool
+        self.store = store
+        self.batch_size = batch_size
+        self.retry_interval = retry_interval
+        self.wakeup = threading.Event()
+
+    def drain(self):
+        """Upload until the spool is empty, returns False on failure"""
+        while True:
+            readings, offset = self.spool.read(self.batch_size)
+            if offset is None:
+                return True
+            if readings:
+                try:
+                    self.store(readings)
+                except Exception as e:
+                    logging.error(f"Failed to upload {len(readings)} readings: {e}")
+                    return False
+            self.spool.commit(offset)
+
+    def run(self):
+        while True:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            while not self.drain():
+                self.wakeup.wait(self.retry_interval)
+                self.wakeup.clear()
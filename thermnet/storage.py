@@ -0,0 +1,183 @@
+import math
+from datetime import datetime, timezone
+
+import sqlalchemy as sa
+
+QUANTITIES = {"temperature": 1, "pressure": 2, "humidity": 3}
+ROLLUP_RESOLUTIONS = (60, 900, 3600)
+
+# Quantity IDs and the readings columns holding them, a new quantity takes a
+# new nullable column
+COLUMNS = {1: "temperature", 2: "pressure", 3: "humidity"}
+
+readings_table = sa.table(
+    "readings",
+    sa.column("time"),
+    sa.column("sensor"),
+    *(sa.column(column) for column in COLUMNS.values()),
+)
+
+measurement_rollups = sa.table(
+    "measurement_rollups",
+    sa.column("resolution"),
+    sa.column("bucket"),
+    sa.column("sensor"),
+    sa.column("quantity"),
+    sa.column("min"),
+    sa.column("max"),
+    sa.column("sum"),
+    sa.column("count"),
+)
+
+
+ROLLUP_COLUMNS = (
+    "resolution",
+    "bucket",
+    "sensor",
+    "quantity",
+    "min",
+    "max",
+    "sum",
+    "count",
+)
+
+# Built once, the buckets go in as one array per column. Building and
+# compiling an INSERT ... ON CONFLICT construct per request cost more CPU
+# than all the rest of the ingest path.
+UPSERT_ROLLUPS = sa.text(
+    """
+    INSERT INTO measurement_rollups AS stored
+        (resolution, bucket, sensor, quantity, min, max, sum, count)
+    SELECT * FROM unnest(
+        CAST(:resolution AS integer[]),
+        CAST(:bucket AS timestamptz[]),
+        CAST(:sensor AS integer[]),
+        CAST(:quantity AS integer[]),
+        CAST(:min AS double precision[]),
+        CAST(:max AS double precision[]),
+        CAST(:sum AS double precision[]),
+        CAST(:count AS integer[])
+    )
+    ON CONFLICT (resolution, sensor, quantity, bucket) DO UPDATE SET
+        min = least(stored.min, excluded.min),
+        max = greatest(stored.max, excluded.max),
+        sum = stored.sum + excluded.sum,
+        count = stored.count + excluded.count
+    """
+)
+
+
+class Reading:
+    """
+    One sample of a sensor, `values` maps quantity IDs to measured values.
+    Readings aggregating several samples also carry `stats`, mapping quantity
+    IDs to (min, max, sum, count) of the samples, `values` being their means.
+    """
+
+    __slots__ = ("time", "sensor", "values", "stats")
+
+    def __init__(self, time, sensor, values, stats=None):
+        self.time = time
+        self.sensor = sensor
+        self.values = values
+        self.stats = stats
+
+
+def parse_time(value):
+    """Parse a UNIX timestamp or an ISO 8601 string, naive times are UTC"""
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid time: {value}")
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, timezone.utc)
+    if isinstance(value, str):
+        time = datetime.fromisoformat(value)
+        if time.tzinfo is None:
+            time = time.replace(tzinfo=timezone.utc)
+        return time
+    raise ValueError(f"Invalid time: {value}")
+
+
+def check_time(time, now, max_skew, max_age=None):
+    """
+    Reject a reading time more than `max_skew` ahead of `now` or, if given,
+    older than `max_age`
+    """
+    if time > now + max_skew:
+        raise ValueError(f"Time {time.isoformat()} is in the future")
+    if max_age is not None and time < now - max_age:
+        raise ValueError(f"Time {time.isoformat()} is too old")
+    return time
+
+
+def parse_values(data):
+    """Pick known quantities from a request object, requires at least one"""
+    values = {}
+    for name, quantity in QUANTITIES.items():
+        if name not in data:
+            continue
+        value = data[name]
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"Invalid {name}: {value}")
+        # json.loads lets NaN and Infinity through, browsers reject them
+        if not math.isfinite(value):
+            raise ValueError(f"Invalid {name}: {value}")
+        values[quantity] = float(value)
+    if not values:
+        raise ValueError(f"None of {', '.join(QUANTITIES)} found")
+    return values
+
+
+def insert_readings(readings):
+    """Multi-row INSERT of `readings`, one row each"""
+    return readings_table.insert().values(
+        [
+            {
+                "time": reading.time,
+                "sensor": reading.sensor,
+                **{
+                    column: reading.values.get(quantity)
+                    for quantity, column in COLUMNS.items()
+                },
+            }
+            for reading in readings
+        ]
+    )
+
+
+def upsert_rollups(readings):
+    """Fold `readings` into the rollup buckets of every resolution"""
+    buckets = {}
+    for reading in readings:
+        timestamp = int(reading.time.timestamp())
+        for resolution in ROLLUP_RESOLUTIONS:
+            bucket = timestamp - timestamp % resolution
+            for quantity, value in reading.values.items():
+                if reading.stats is not None:
+                    min_, max_, sum_, count = reading.stats[quantity]
+                else:
+                    min_, max_, sum_, count = value, value, value, 1
+                key = (resolution, bucket, reading.sensor, quantity)
+                if key not in buckets:
+                    buckets[key] = [min_, max_, sum_, count]
+                    continue
+                aggregate = buckets[key]
+                aggregate[0] = min(aggregate[0], min_)
+                aggregate[1] = max(aggregate[1], max_)
+                aggregate[2] += sum_
+                aggregate[3] += count
+
+    rows = [
+        (resolution, datetime.fromtimestamp(bucket, timezone.utc), sensor, quantity)
+        + tuple(aggregate)
+        for (resolution, bucket, sensor, quantity), aggregate in sorted(
+            buckets.items()
+        )
+    ]
+    return UPSERT_ROLLUPS.bindparams(
+        **{name: list(column) for name, column in zip(ROLLUP_COLUMNS, zip(*rows))}
+    )
+
+
+def write_readings(readings):
+    """Statements storing `readings`, to be executed in one transaction"""
+    return [insert_readings(readings), upsert_rollups(readings)]
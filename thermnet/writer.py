@@ -0,0 +1,143 @@
+import asyncio
+import logging
+from time import monotonic
+
+import psycopg2
+
+from thermnet.storage import write_readings
+
+# Errors caused by the readings themselves, e.g. a sensor deleted while its
+# secret was still cached, retrying the same batch can never succeed
+DATA_ERRORS = (psycopg2.IntegrityError, psycopg2.DataError)
+
+
+class QueueFull(Exception):
+    pass
+
+
+class WriteBehind:
+    """
+    Bounded queue of readings written to the database in batches, flushed
+    when `batch_size` readings are pending or `flush_interval` seconds after
+    the first pending one arrived. A batch failing on its data is split until
+    the offending readings are isolated, those are logged and dropped. Other
+    workers hear of the readings over `bus` once their batch commits. The
+    duration and size of each flush are observed into the `flush_seconds`
+    and `batch_sizes` histograms if given.
+    """
+
+    def __init__(
+        self,
+        engine,
+        bus,
+        max_pending,
+        batch_size,
+        flush_interval,
+        flush_seconds=None,
+        batch_sizes=None,
+    ):
+        self.engine = engine
+        self.bus = bus
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.flush_seconds = flush_seconds
+        self.batch_sizes = batch_sizes
+        self.pending = []
+        self.closed = False
+
+        self.batches = 0
+        self.written = 0
+        self.dead_lettered = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.ensure_future(self.run())
+
+    def put(self, readings):
+        """Enqueue all of `readings` or none of them"""
+        if self.closed or len(self.pending) + len(readings) > self.max_pending:
+            raise QueueFull()
+        self.pending.extend(readings)
+        self._wakeup.set()
+
+    async def run(self):
+        while self.pending or not self.closed:
+            await self._wait()
+            batch = self.pending[: self.batch_size]
+            if not batch:
+                continue
+            try:
+                await self._write(batch)
+            except Exception as e:
+                # Keep the rest queued, new readings get 503 once it is full
+                logging.warning(f"Failed to write {len(batch)} readings: {e}")
+                await asyncio.sleep(self.flush_interval)
+
+    async def _write(self, batch):
+        """
+        Write `batch`, the head of the queue, dequeueing its readings as they
+        are written or dropped
+        """
+        try:
+            await self.flush(batch)
+        except DATA_ERRORS as e:
+            if len(batch) > 1:
+                middle = len(batch) // 2
+                await self._write(batch[:middle])
+                await self._write(batch[middle:])
+                return
+            reading = batch[0]
+            self.dead_lettered += 1
+            logging.error(
+                f"Dropping reading of sensor {reading.sensor} at "
+                f"{reading.time.isoformat()} {reading.values}: {e}"
+            )
+        del self.pending[: len(batch)]
+
+    async def _wait(self):
+        while not self.pending and not self.closed:
+            self._wakeup.clear()
+            await self._wakeup.wait()
+
+        deadline = monotonic() + self.flush_interval
+        while len(self.pending) < self.batch_size and not self.closed:
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), deadline - monotonic())
+            except asyncio.TimeoutError:
+                return
+
+    async def flush(self, batch):
+        start = monotonic()
+        stmts = write_readings(batch) + self.bus.statements(batch)
+        async with self.engine.acquire() as conn:
+            async with conn.begin():
+                for stmt in stmts:
+                    await conn.execute(stmt)
+        latency = monotonic() - start
+        await self.bus.committed(batch)
+
+        self.batches += 1
+        self.written += len(batch)
+        if self.flush_seconds is not None:
+            self.flush_seconds.observe(latency)
+        if self.batch_sizes is not None:
+            self.batch_sizes.observe(len(batch))
+        self.last_flush_latency = latency
+        self.max_flush_latency = max(self.max_flush_latency, latency)
+        logging.debug(f"Flushed {len(batch)} readings in {latency * 1000:.1f} ms")
+
+    async def close(self, timeout):
+        """Stop accepting readings and wait for the pending ones to be written"""
+        self.closed = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+            logging.error(f"Dropping {len(self.pending)} unwritten readings")